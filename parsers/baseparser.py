@@ -1,11 +1,19 @@
-import cookielib
+import anydbm
+import hashlib
 import logging
 import re
 import socket
 import sys
+import threading
 import time
 import urllib2
 
+import bs4
+
+import httpclient
+import lxmlsoup
+import retry
+
 # Define a logger
 
 # This formatter is like the default but uses a period rather than a comma
@@ -27,25 +35,128 @@ logger.addHandler(ch)
 
 # Utility functions
 
-def grab_url(url, max_depth=5, opener=None):
-    timeout = 5
-    if opener is None:
-        cj = cookielib.CookieJar()
-        opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(cj))
-    retry = False
-    try:
-        text = opener.open(url, timeout=timeout).read()
+class NotModified(Exception):
+    """The server says the page hasn't changed since we last fetched it"""
+
+class ValidatorCache(object):
+    """ETag and Last-Modified headers from earlier fetches, by URL.
+
+    Kept in a dbm file, so it lasts from one scraper run to the next.
+    """
+
+    def __init__(self, path):
+        self.db = anydbm.open(path, 'c')
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        """Return {header: value} for the last fetch of url, or None"""
+        with self.lock:
+            try:
+                value = self.db[url.encode('utf8')]
+            except KeyError:
+                return None
+        etag, last_modified = value.split('\n', 1)
+        validators = {}
+        if etag:
+            validators['ETag'] = etag
+        if last_modified:
+            validators['Last-Modified'] = last_modified
+        return validators
+
+    def set(self, url, validators):
+        value = '%s\n%s' % (validators.get('ETag', ''),
+                            validators.get('Last-Modified', ''))
+        with self.lock:
+            self.db[url.encode('utf8')] = value
+
+    def forget(self, url):
+        with self.lock:
+            try:
+                del self.db[url.encode('utf8')]
+            except KeyError:
+                pass
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+# Set by the scraper to make article fetches conditional
+validator_cache = None
+
+# Server errors worth trying again after
+RETRY_CODES = (500, 502, 503, 504)
+
+# How grab_url retries
+retry_policy = retry.RetryPolicy()
+# Set by the scraper to give up on sites that are down
+circuit_breaker = None
+
+def grab_url(url, session=None, validators=None, policy=None):
+    """Download url and return its contents.
+
+    If validators is a dict, it may hold the 'ETag' and 'Last-Modified'
+    headers from an earlier fetch; if the server then reports that the
+    page is unchanged, raise NotModified.  Otherwise the dict is
+    replaced by the new response's headers.
+
+    Timeouts, failed connections, server errors and the NYT's ad
+    interstitial are retried according to policy (default
+    retry_policy).  If circuit_breaker has given up on url's site,
+    raise retry.CircuitOpen.
+    """
+    if session is None:
+        session = httpclient.new_session()
+    if policy is None:
+        policy = retry_policy
+    headers = {}
+    if validators:
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+    if circuit_breaker is not None:
+        circuit_breaker.before(url)
+    site_down = False
+    for attempt in range(policy.attempts):
+        if attempt:
+            time.sleep(policy.delay(attempt))
+        site_down = True
+        try:
+            response = httpclient.fetch(url, headers, session)
+        except urllib2.HTTPError as e:
+            if e.code in RETRY_CODES:
+                logger.warn('Got {0} from {1}'.format(e.code, url))
+                continue
+            if circuit_breaker is not None:
+                circuit_breaker.succeeded(url)
+            if e.code == 304 and validators:
+                raise NotModified(url)
+            raise
+        except socket.timeout:
+            logger.warn('Timed out while requesting {0} (timeout: {1})'.format(url, httpclient.TIMEOUT))
+            continue
+        except urllib2.URLError as e:
+            logger.warn('Unable to connect to {0}: {1}'.format(url, e.reason))
+            continue
+        site_down = False
+        if circuit_breaker is not None:
+            circuit_breaker.succeeded(url)
+        text = response.content
         if '<title>NY Times Advertisement</title>' in text:
-            retry = True
-    except socket.timeout:
-        logger.warn('Timed out while requesting {0} (timeout: {1})'.format(url, timeout))
-        retry = True
-    if retry:
-        if max_depth == 0:
-            raise Exception('Too many attempts to download %s' % url)
-        time.sleep(0.5)
-        return grab_url(url, max_depth-1, opener)
-    return text
+            continue
+        if validators is not None:
+            validators.clear()
+            for header in ('ETag', 'Last-Modified'):
+                value = response.headers.get(header)
+                if value:
+                    validators[header] = value
+        return text
+    if site_down and circuit_breaker is not None:
+        if circuit_breaker.failed(url):
+            logger.error('Too many failures from %s; not fetching from '
+                         'there for %s seconds', url.split('/')[2],
+                         circuit_breaker.cooldown)
+    raise Exception('Too many attempts to download %s' % url)
 
 
 
@@ -85,6 +196,44 @@ def parse_double_utf8(txt):
 def canonicalize(text):
     return strip_whitespace(parse_double_utf8(text))
 
+def html_digest(html):
+    """Return a hash of html that ignores whitespace and comments.
+
+    Pages often differ from one fetch to the next only in a timestamp
+    comment or in whitespace, which never affects what we store.
+    """
+    html = re.sub(r'(?s)<!--.*?-->', '', html)
+    return hashlib.sha1(' '.join(html.split())).hexdigest()
+
+def wanted(patterns, name, attrs):
+    """Whether a tag matches one of patterns, as in BaseParser.parse_only.
+
+    A pattern matches a tag with its name and with each of its
+    attributes, where a class matches if it's the tag's whole class
+    or one of its words.  attrs is a dict or a list of pairs.
+    """
+    attrs = dict(attrs)
+    for pattern_name, pattern_attrs in patterns:
+        if name != pattern_name:
+            continue
+        for key, value in pattern_attrs.items():
+            actual = attrs.get(key)
+            if isinstance(actual, list): # bs4's multi-valued attributes
+                actual = ' '.join(actual)
+            if actual is None:
+                break
+            if actual != value and not (key == 'class' and
+                                        value in actual.split()):
+                break
+        else:
+            return True
+    return False
+
+# Tree builders for BaseParser.backend, those whose libraries are installed
+soup_backends = {}
+if lxmlsoup.lxml is not None:
+    soup_backends['lxml'] = lxmlsoup.LxmlSoup
+
 def concat(domain, url):
     return domain + url if url.startswith('/') else domain + '/' + url
 
@@ -113,21 +262,115 @@ class BaseParser(object):
 
     feeder_bs = BeautifulSoup #use this version of beautifulsoup for feed
 
-    def __init__(self, url):
+    # How make_soup() builds trees: None for the parser's own choice of
+    # BeautifulSoup, or one of soup_backends
+    backend = None
+
+    # If set, the parts of the page _parse needs, as a list of
+    # (tag name, {attribute: value}); see wanted().  make_soup skips
+    # building the rest of the tree where it safely can, i.e. for bs4
+    # parsers when lxml is installed.
+    parse_only = None
+
+    # Politeness limits on requests to self.domains (see ratelimit.py)
+    max_rate = 2.  # requests per second, on average
+    max_burst = 5  # requests at once after a lull
+
+    not_modified = False # Set if the page hasn't changed since last time
+    same_html = False    # Set if the page's html_digest is known_digest
+    validators = None    # ETag/Last-Modified of this fetch, if cached
+    html = None
+    html_digest = None
+
+    def __init__(self, url, conditional=True, known_digest=None, fetch=True):
+        """Fetch url and parse it, if it needs parsing.
+
+        With fetch=False, do neither: call fetch() and then, if
+        needs_parsing(), parse() to do the same in two steps.
+        """
         self.url = url
+        self.conditional = conditional
+        self.known_digest = known_digest
+        if fetch:
+            self.fetch()
+            if self.needs_parsing():
+                self.parse()
+
+    def fetch(self):
+        """Download the page into self.html"""
+        if validator_cache is not None:
+            self.validators = {}
+            if self.conditional:
+                self.validators = (validator_cache.get(self._printableurl())
+                                   or {})
         try:
-            self.html = grab_url(self._printableurl())
+            self.html = grab_url(self._printableurl(),
+                                 validators=self.validators)
+        except NotModified:
+            self.not_modified = True
+            return
         except urllib2.HTTPError as e:
             if e.code == 404:
                 self.real_article = False
                 return
             raise
         logger.debug('got html')
+        self.html_digest = html_digest(self.html)
+        if self.conditional and self.html_digest == self.known_digest:
+            self.same_html = True
+
+    def needs_parsing(self):
+        """Whether the fetched page is new and worth parsing"""
+        return (self.html is not None and self.real_article and
+                not self.same_html)
+
+    def parse(self):
         self._parse(self.html)
 
     def _printableurl(self):
         return self.url + self.SUFFIX
 
+    def remember_validators(self):
+        """Make the next fetch of this article conditional on this one.
+
+        Call this only once the article has been stored, so that a
+        failure to store it isn't hidden by a later "not modified".
+        """
+        if validator_cache is not None and self.validators is not None:
+            validator_cache.set(self._printableurl(), self.validators)
+
+    def make_soup(self, html, beautifulsoup, **kwargs):
+        """Return html parsed into a tree, with self.backend.
+
+        By default that's beautifulsoup(html, **kwargs).  The other
+        backends only offer the BeautifulSoup 3 calls listed in
+        lxmlsoup, so only parsers sticking to those should use this.
+        They are called as backend(html, comments=...), with comments
+        true for BeautifulSoup 3, whose getText() includes comments.
+
+        With bs4 on lxml, if self.parse_only is set, only the tags it
+        asks for (and what's inside them) go into the tree.  Not with
+        BeautifulSoup 3 or bs4's other tree builders: they leave a tag
+        the page doesn't close open until its own closing tag, since
+        the closing tags of its (skipped) containers don't count, so
+        the text after it would end up inside it.  lxml closes it as it
+        would in the whole page.
+        """
+        if self.backend is None:
+            if (self.parse_only is not None and lxmlsoup.lxml is not None and
+                not issubclass(beautifulsoup, BeautifulSoup) and
+                kwargs.get('features', 'lxml') == 'lxml'):
+                keep = lambda name, attrs: wanted(self.parse_only, name,
+                                                  attrs)
+                # Whichever builder bs4 would pick, so that the tree is
+                # the one it would build for the whole page
+                kwargs['features'] = 'lxml'
+                kwargs['parse_only'] = bs4.SoupStrainer(keep)
+            return beautifulsoup(html, **kwargs)
+        # Match the getText() of the BeautifulSoup the parser expects
+        return soup_backends[self.backend](
+            html, comments=issubclass(beautifulsoup, BeautifulSoup))
+
     def _parse(self, html):
         """Should take html and populate self.(date, title, byline, body)
 
@@ -143,16 +386,20 @@ class BaseParser(object):
     def feed_urls(cls):
         all_urls = []
         for feeder_url in cls.feeder_pages:
-            html = grab_url(feeder_url)
-            soup = cls.feeder_bs(html)
+            all_urls = all_urls + cls.feed_urls_from(feeder_url)
+        return all_urls
 
-            # "or ''" to make None into str
-            urls = [a.get('href') or '' for a in soup.findAll('a')]
+    @classmethod
+    def feed_urls_from(cls, feeder_url):
+        """Return the article URLs linked from one of cls.feeder_pages"""
+        html = grab_url(feeder_url)
+        soup = cls.feeder_bs(html)
 
-            # If no http://, prepend domain name
-            domain = '/'.join(feeder_url.split('/')[:3])
-            urls = [url if '://' in url else concat(domain, url) for url in urls]
+        # "or ''" to make None into str
+        urls = [a.get('href') or '' for a in soup.findAll('a')]
 
-            all_urls = all_urls + [url for url in urls if
-                                   re.search(cls.feeder_pat, url)]
-        return all_urls
+        # If no http://, prepend domain name
+        domain = '/'.join(feeder_url.split('/')[:3])
+        urls = [url if '://' in url else concat(domain, url) for url in urls]
+
+        return [url for url in urls if re.search(cls.feeder_pat, url)]
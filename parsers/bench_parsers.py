@@ -0,0 +1,210 @@
+#!/usr/bin/python
+"""
+Benchmark the parsers offline, on pages saved from their sites.
+
+First save some pages (this needs the network):
+
+$ python bench_parsers.py record fixtures
+[saves up to --pages current articles for each parser in parsers.parsers]
+$ python bench_parsers.py record fixtures bbc.BBCParser
+[just for the BBC]
+
+Then, anywhere, as often as you like:
+
+$ python bench_parsers.py run fixtures
+[for each parser: time per article, peak memory, and which pages came
+ out differently between runs or from when they were saved]
+
+Pass --backend lxml or --whole-page to run to try the other ways of
+building trees (see BaseParser.make_soup).
+
+Each parser's pages are kept in fixtures/<modulename>.<classname>/:
+NNN.html is the page as downloaded, NNN.txt the text the parser stored
+for it then, and urls lists "NNN url" for each page.
+"""
+
+import cPickle
+import hashlib
+import optparse
+import os
+import resource
+import sys
+import time
+
+import baseparser
+from __init__ import parsers
+
+REPEAT = 5
+
+def load_parser(parsername):
+    module, classname = parsername.rsplit('.', 1)
+    return getattr(__import__(module, globals(), fromlist=[classname]),
+                   classname)
+
+def record(parsername, directory, pages):
+    """Save up to pages of the parser's current articles in directory"""
+    parser = load_parser(parsername)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    urls = parser.feed_urls()
+    saved = []
+    for url in urls:
+        if len(saved) >= pages:
+            break
+        try:
+            article = parser(url, conditional=False, fetch=False)
+            article.fetch()
+            if not article.needs_parsing():
+                continue
+            article.parse()
+        except Exception as e:
+            print >> sys.stderr, 'Skipping %s: %r' % (url, e)
+            continue
+        if not article.real_article:
+            continue
+        name = '%03d' % len(saved)
+        with open(os.path.join(directory, name + '.html'), 'wb') as f:
+            f.write(article.html)
+        with open(os.path.join(directory, name + '.txt'), 'wb') as f:
+            f.write(unicode(article).encode('utf8'))
+        saved.append((name, url))
+    with open(os.path.join(directory, 'urls'), 'w') as f:
+        for name, url in saved:
+            f.write('%s %s\n' % (name, url))
+    print '%-24s saved %d of %d articles' % (parsername, len(saved),
+                                             len(urls))
+
+def load_fixtures(directory):
+    """Return [(url, html, text stored when recorded)]"""
+    fixtures = []
+    with open(os.path.join(directory, 'urls')) as f:
+        for line in f:
+            name, url = line.split()
+            path = os.path.join(directory, name)
+            with open(path + '.html', 'rb') as page:
+                html = page.read()
+            with open(path + '.txt', 'rb') as page:
+                text = page.read().decode('utf8')
+            fixtures.append((url, html, text))
+    return fixtures
+
+def measure(parser, fixtures, repeat, backend, whole_page):
+    """Parse each fixture repeat times.
+
+    Return (best seconds per article, mean seconds per article,
+    [(url, text differs between runs, text differs from recorded)]).
+    """
+    times = []
+    digests = [set() for fixture in fixtures]
+    changed = [False] * len(fixtures)
+    for i in range(repeat):
+        start = time.time()
+        for j, (url, html, recorded) in enumerate(fixtures):
+            article = parser(url, fetch=False)
+            article.backend = backend
+            if whole_page:
+                article.parse_only = None
+            article.html = html
+            try:
+                article.parse()
+                text = unicode(article) if article.real_article else None
+            except Exception as e:
+                text = 'Failed: %r' % e
+            digests[j].add(hashlib.sha1(repr(text)).hexdigest())
+            if text != recorded:
+                changed[j] = True
+        times.append((time.time() - start) / len(fixtures))
+    return (min(times), sum(times) / len(times),
+            [(url, len(digests[j]) > 1, changed[j])
+             for j, (url, html, recorded) in enumerate(fixtures)])
+
+def run(parsername, directory, options):
+    """Benchmark one parser in a child process.
+
+    Forking gives each parser a fresh process, so its peak memory
+    (from wait4) isn't mixed up with the other parsers'.  Return
+    (results of measure(), peak resident kilobytes).
+    """
+    fixtures = load_fixtures(directory)
+    if not fixtures:
+        return None, None
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = measure(load_parser(parsername), fixtures,
+                             options.repeat, options.backend,
+                             options.whole_page)
+        except Exception as e:
+            result = e
+        with os.fdopen(write_end, 'wb') as f:
+            cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as f:
+        result = cPickle.load(f)
+    pid, status, rusage = os.wait4(pid, 0)
+    if isinstance(result, Exception):
+        raise result
+    peak = rusage.ru_maxrss
+    if sys.platform == 'darwin':  # bytes there, kilobytes elsewhere
+        peak //= 1024
+    return result, peak
+
+def main():
+    usage = ('usage: %prog record <fixture_dir> [<modulename>.<classname>...]\n'
+             '       %prog run <fixture_dir> [<modulename>.<classname>...]')
+    optparser = optparse.OptionParser(usage=usage)
+    optparser.add_option('--pages', type='int', default=10,
+                         help='record: articles to save per parser')
+    optparser.add_option('--repeat', type='int', default=REPEAT,
+                         help='run: times to parse each page')
+    optparser.add_option('--backend', default=None,
+                         choices=sorted(baseparser.soup_backends),
+                         help='run: build trees with this backend')
+    optparser.add_option('--whole-page', action='store_true', default=False,
+                         help="run: ignore the parsers' parse_only")
+    options, args = optparser.parse_args()
+    if len(args) < 2 or args[0] not in ('record', 'run'):
+        optparser.error('need a command and a fixture directory')
+    command, fixture_dir = args[:2]
+    names = args[2:] or sorted('%s.%s' % (parser.__module__, parser.__name__)
+                               for parser in parsers)
+
+    if command == 'record':
+        for parsername in names:
+            record(parsername, os.path.join(fixture_dir, parsername),
+                   options.pages)
+        return
+
+    names = [name for name in names
+             if os.path.isdir(os.path.join(fixture_dir, name))]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        baseline //= 1024
+    print '%-24s %5s %10s %10s %10s  %s' % ('parser', 'pages', 'best ms',
+                                            'mean ms', 'peak MB', 'unstable')
+    problems = []
+    for parsername in names:
+        result, peak = run(parsername, os.path.join(fixture_dir, parsername),
+                           options)
+        if result is None:
+            continue
+        best, mean, pages = result
+        unstable = sum(1 for url, differs, changed in pages if differs)
+        print '%-24s %5d %10.1f %10.1f %10.1f  %d' % (
+            parsername, len(pages), best * 1000, mean * 1000,
+            max(0, peak - baseline) / 1024., unstable)
+        for url, differs, changed in pages:
+            if differs:
+                problems.append('%s: different text between runs' % url)
+            elif changed:
+                problems.append('%s: different text from when recorded' % url)
+    print '(peak MB is above the %.1f MB used before parsing)' % (
+        baseline / 1024.)
+    for problem in problems:
+        print problem
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Shared, pooled HTTP connections for fetching pages.
+
+Opening a fresh TCP (and often TLS) connection for every article is a
+large part of the time it takes to check one.  All fetches go through
+a single requests HTTPAdapter instead, which keeps up to POOL_SIZE
+keep-alive connections open to each host.
+
+Cookies are not shared: each call to new_session() gets an empty
+cookie jar (but the shared connections), so that one article's
+cookies, e.g. the NYT's article meter, don't leak into the next.
+grab_url uses one session per page, across retries.
+
+Errors are reported the way urllib2 reports them, which is what the
+parsers and the scraper expect: urllib2.HTTPError for non-2xx
+responses, socket.timeout on timeouts, and urllib2.URLError when the
+connection fails.
+
+If rate_limiter (a ratelimit.RateLimiter) is set, each fetch waits
+its turn for the site, and 429 and 503 responses make it back off.
+"""
+
+import logging
+import socket
+import threading
+import urllib2
+
+import requests
+import requests.adapters
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+
+# Keep-alive connections kept open per host
+POOL_SIZE = 10
+# Seconds to wait to connect, and between bytes of the response
+TIMEOUT = 5
+# Number of hosts to keep connection pools for
+NUM_POOLS = 50
+
+# Servers have seen urllib2's User-Agent for years; don't rock the boat.
+USER_AGENT = 'Python-urllib/%s' % urllib2.__version__
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+_adapter = None
+_adapter_lock = threading.Lock()
+
+# Set by the scraper to limit the rate of requests to each site
+rate_limiter = None
+
+def configure(pool_size=None, timeout=None):
+    """Change POOL_SIZE and TIMEOUT; call this before fetching anything"""
+    global POOL_SIZE, TIMEOUT, _adapter
+    with _adapter_lock:
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if timeout is not None:
+            TIMEOUT = timeout
+        _adapter = None
+
+def get_adapter():
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            _adapter = requests.adapters.HTTPAdapter(pool_connections=NUM_POOLS,
+                                                     pool_maxsize=POOL_SIZE)
+        return _adapter
+
+def new_session():
+    """Return a session with its own cookies but the shared connections"""
+    session = requests.Session()
+    adapter = get_adapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+class Response(object):
+    """What fetch() returns: the body, status and headers of a response"""
+
+    def __init__(self, url, status, headers, content):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+def fetch(url, headers=None, session=None, timeout=None):
+    """GET url, following redirects, and return a Response.
+
+    Raise urllib2.HTTPError if the final status isn't 2xx.
+    """
+    if session is None:
+        session = new_session()
+    if timeout is None:
+        timeout = TIMEOUT
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    try:
+        r = session.get(url, headers=headers, timeout=timeout)
+        content = r.content
+    except requests.Timeout as e:
+        raise socket.timeout(str(e))
+    except requests.ConnectionError as e:
+        # A timeout while reading the body comes out as a ConnectionError
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            raise socket.timeout(str(e))
+        raise urllib2.URLError(e)
+    except requests.RequestException as e:
+        raise urllib2.URLError(e)
+    if rate_limiter is not None:
+        if r.status_code in (429, 503):
+            delay = rate_limiter.back_off(url, r.headers.get('Retry-After'))
+            logger.warning('Got %s from %s; backing off for %s seconds',
+                           r.status_code, url, delay)
+        else:
+            rate_limiter.succeeded(url)
+    if not 200 <= r.status_code < 300:
+        raise urllib2.HTTPError(r.url, r.status_code, r.reason, r.headers,
+                                None)
+    return Response(r.url, r.status_code, r.headers, content)
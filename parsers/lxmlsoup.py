@@ -0,0 +1,160 @@
+"""A BeautifulSoup lookalike on top of lxml.
+
+lxml builds its tree in C, several times faster than BeautifulSoup's
+pure-Python parser.  LxmlSoup and LxmlTag offer the parts of the
+BeautifulSoup API our parsers use -- find, findAll, get, [],
+getText and childGenerator -- so a parser that sticks to them can run
+on either; see BaseParser.make_soup.
+
+Matching follows BeautifulSoup 3.  name may be a tag name, a list of
+them, or a function called with the tag.  attrs (and keyword
+arguments) map attribute names to a string, a regular expression,
+True (present), None (absent) or a function of the value; a string
+in place of attrs means the class.  A string matches a class if it
+is the whole attribute or one of its words.
+
+Unlike BeautifulSoup, there are only tags: childGenerator() skips
+text.  getText() includes the text of comments only with comments=True,
+as BeautifulSoup 3's does (with baseparser's fix) and bs4's doesn't.
+"""
+
+import re
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+def parse_html(html):
+    """Return the lxml tree for html, a str or unicode page"""
+    if lxml is None:
+        raise ImportError('The lxml backend needs lxml installed')
+    if isinstance(html, str):
+        try:
+            html = html.decode('utf8')
+        except UnicodeDecodeError:
+            # Leave it to lxml to go by the page's charset
+            return lxml.html.document_fromstring(html)
+    # lxml refuses unicode that declares an encoding
+    return lxml.html.document_fromstring(XML_DECLARATION.sub(u'', html))
+
+def is_tag(element):
+    # Comments and processing instructions have functions as tags
+    return isinstance(element.tag, basestring)
+
+def strings(element, comments=False):
+    """Yield the text in element, in document order"""
+    if element.text:
+        yield element.text
+    for child in element:
+        if is_tag(child):
+            for s in strings(child, comments):
+                yield s
+        elif (comments and child.tag is lxml.etree.Comment and
+              child.text):
+            yield child.text
+        if child.tail:
+            yield child.tail
+
+def matches(value, match):
+    if match is True:
+        return value is not None
+    if match is None:
+        return value is None
+    if value is None:
+        return False
+    if hasattr(match, 'search'):
+        return match.search(value) is not None
+    if callable(match):
+        return match(value)
+    if isinstance(match, (list, tuple)):
+        return value in match
+    return value == match
+
+class LxmlTag(object):
+    """An lxml element that looks like a BeautifulSoup Tag"""
+
+    def __init__(self, element, comments=False):
+        self.element = element
+        self.comments = comments
+
+    @property
+    def name(self):
+        return self.element.tag
+
+    def get(self, key, default=None):
+        return self.element.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.element.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def getText(self, separator=u''):
+        return separator.join(strings(self.element, self.comments))
+    get_text = getText
+
+    def childGenerator(self):
+        for child in self.element:
+            if is_tag(child):
+                yield LxmlTag(child, self.comments)
+
+    def _candidates(self):
+        return self.element.iterdescendants()
+
+    def findAll(self, name=None, attrs={}, limit=None, **kwargs):
+        if isinstance(attrs, basestring):
+            attrs = {'class': attrs}
+        attrs = dict(attrs, **kwargs)
+        if 'class_' in attrs:
+            attrs['class'] = attrs.pop('class_')
+        if isinstance(name, basestring):
+            name = [name]
+        results = []
+        for element in self._candidates():
+            if not is_tag(element):
+                continue
+            if isinstance(name, list) and element.tag not in name:
+                continue
+            tag = LxmlTag(element, self.comments)
+            if callable(name) and not name(tag):
+                continue
+            if not all(self._attr_matches(element, key, match)
+                       for key, match in attrs.items()):
+                continue
+            results.append(tag)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+    find_all = findAll
+
+    @staticmethod
+    def _attr_matches(element, key, match):
+        value = element.get(key)
+        if (key == 'class' and isinstance(match, basestring) and
+            value is not None and ' ' not in match):
+            return match in value.split()
+        return matches(value, match)
+
+    def find(self, name=None, attrs={}, **kwargs):
+        results = self.findAll(name, attrs, limit=1, **kwargs)
+        if results:
+            return results[0]
+        return None
+
+    def __unicode__(self):
+        return lxml.html.tostring(self.element, encoding=unicode)
+
+class LxmlSoup(LxmlTag):
+    """A whole page, parsed by lxml"""
+
+    def __init__(self, html, comments=False):
+        LxmlTag.__init__(self, parse_html(html), comments)
+
+    def _candidates(self):
+        # The soup stands above <html>, so that is searched too
+        return self.element.iter()
@@ -0,0 +1,111 @@
+"""Keeping the rate of requests to each site polite.
+
+Each domain gets a token bucket: requests may go out in a burst of up
+to max_burst, but on average no faster than max_rate a second.  Both
+are set per parser (BaseParser.max_rate and max_burst) for the
+parser's domains.
+
+When a site answers 429 (Too Many Requests) or 503 (Service
+Unavailable), nothing more is sent to it for its Retry-After time if
+it gives one, and otherwise for a delay that doubles with each such
+answer in a row.
+"""
+
+import threading
+import time
+
+# Backoff after a 429/503 without a usable Retry-After, in seconds
+BACKOFF_START = 5
+# Longest backoff, whatever the site asks for
+BACKOFF_MAX = 300
+
+class TokenBucket(object):
+    """Allow about rate requests a second, in bursts of up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        # Tokens are counted as of this time, which is in the future
+        # while backing off.
+        self.updated = time.time()
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """Take a token; return how many seconds to wait before using it"""
+        with self.lock:
+            now = time.time()
+            if now > self.updated:
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+            self.tokens -= 1
+            return ((self.updated - now) +
+                    max(0., -self.tokens) / self.rate)
+
+    def back_off(self, delay=None):
+        """Send nothing for delay seconds (default: exponential backoff)
+
+        Return the delay used.
+        """
+        with self.lock:
+            self.failures += 1
+            if delay is None:
+                delay = BACKOFF_START * 2 ** (self.failures - 1)
+            delay = min(delay, BACKOFF_MAX)
+            self.updated = max(self.updated, time.time() + delay)
+            self.tokens = min(self.tokens, 0.)
+            return delay
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+
+class RateLimiter(object):
+    """A TokenBucket for each domain.
+
+    limits is {domain: (rate, burst)}; other domains get default.
+    """
+
+    def __init__(self, limits, default=(1, 5)):
+        self.limits = limits
+        self.default = default
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_parsers(cls, parser_dict, scale=1):
+        """Use each parser's max_rate (times scale) and max_burst"""
+        return cls(dict((domain, (parser.max_rate * scale, parser.max_burst))
+                        for domain, parser in parser_dict.items()))
+
+    def bucket(self, url):
+        domain = url.split('/')[2]
+        with self.lock:
+            if domain not in self.buckets:
+                rate, burst = self.limits.get(domain, self.default)
+                self.buckets[domain] = TokenBucket(rate, burst)
+            return self.buckets[domain]
+
+    def wait(self, url):
+        """Sleep until a request to url is allowed; return the time slept"""
+        delay = self.bucket(url).wait_time()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def back_off(self, url, retry_after=None):
+        """Hold off on url's site, which answered 429 or 503.
+
+        retry_after is the Retry-After header, if any.
+        """
+        try:
+            delay = int(retry_after)
+        except (TypeError, ValueError):
+            # Missing, or an HTTP date, which isn't worth parsing
+            delay = None
+        return self.bucket(url).back_off(delay)
+
+    def succeeded(self, url):
+        self.bucket(url).succeeded()
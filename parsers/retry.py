@@ -0,0 +1,99 @@
+"""Retrying failed fetches, and giving up on sites that are down.
+
+RetryPolicy says how often and how long to wait before trying a page
+again: exponentially longer each time, with "full jitter" (a random
+delay up to the exponential one), so that retries of many pages to
+the same struggling site don't all land at once.
+
+CircuitBreaker gives up on a site for a while once fetches from it
+keep failing.  After `threshold` failed fetches in a row (each after
+its retries) the site's circuit opens, and fetches from it fail at
+once with CircuitOpen until `cooldown` seconds have passed.  Then one
+fetch is let through: if it works the circuit closes, and if not it
+stays open for another cooldown.
+"""
+
+import random
+import threading
+import time
+
+class RetryPolicy(object):
+    """Up to attempts tries, the nth retry after up to base * 2**(n-1)s"""
+
+    def __init__(self, attempts=5, base=0.5, max_delay=30):
+        self.attempts = attempts
+        self.base = base
+        self.max_delay = max_delay
+
+    def delay(self, retry):
+        """Return how long to wait before retry number retry (from 1)"""
+        return random.uniform(0, min(self.max_delay,
+                                     self.base * 2 ** (retry - 1)))
+
+class CircuitOpen(Exception):
+    """We've given up on this site for now"""
+
+class Circuit(object):
+    def __init__(self):
+        self.failures = 0     # failed fetches in a row
+        self.open_until = None
+        self.trial = False    # a fetch is testing a cooled-down circuit
+        self.times_opened = 0
+        self.skipped = 0      # fetches refused while open
+
+class CircuitBreaker(object):
+    """A circuit for each domain"""
+
+    def __init__(self, threshold=5, cooldown=600):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.circuits = {}
+        self.lock = threading.Lock()
+
+    def _circuit(self, url):
+        domain = url.split('/')[2]
+        if domain not in self.circuits:
+            self.circuits[domain] = Circuit()
+        return self.circuits[domain]
+
+    def before(self, url):
+        """Raise CircuitOpen if url's site shouldn't be fetched now"""
+        with self.lock:
+            circuit = self._circuit(url)
+            if circuit.open_until is None:
+                return
+            if time.time() >= circuit.open_until and not circuit.trial:
+                circuit.trial = True
+                return
+            circuit.skipped += 1
+        raise CircuitOpen(url)
+
+    def succeeded(self, url):
+        with self.lock:
+            circuit = self._circuit(url)
+            circuit.failures = 0
+            circuit.open_until = None
+            circuit.trial = False
+
+    def failed(self, url):
+        """Record a failed fetch; return True if the circuit opened"""
+        with self.lock:
+            circuit = self._circuit(url)
+            circuit.failures += 1
+            if not circuit.trial and circuit.failures < self.threshold:
+                return False
+            circuit.trial = False
+            circuit.open_until = time.time() + self.cooldown
+            circuit.times_opened += 1
+            return True
+
+    def summary(self):
+        """Return [(domain, times opened, fetches skipped, still open)]
+
+        for the domains whose circuit has opened.
+        """
+        with self.lock:
+            return sorted((domain, c.times_opened, c.skipped,
+                           c.open_until is not None)
+                          for domain, c in self.circuits.items()
+                          if c.times_opened)
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+"""
+Check that BaseParser.parse_only doesn't change what a parser reads.
+
+$ python test_parse_only.py
+
+Pages leave tags unclosed, and the strained tree must put their text
+where the whole-page tree does.  make_soup only strains for bs4 on
+lxml, so the Washington Post tests need lxml installed; the others
+check that it doesn't strain where the tree would come out wrong.
+"""
+
+import unittest
+
+from BeautifulSoup import BeautifulSoup
+import bs4
+
+import lxmlsoup
+import nyt
+import washpo
+
+# Each kept tag is left open, to be closed by the end of its (skipped)
+# container, before text the parser mustn't read.
+ARTICLE = ('<html><head><meta name=description content="About it"></head>'
+           '<body><div class=headline><h1 property=dc.title>Headline</div>'
+           '<div class=promo>Subscribe now</div>'
+           '<div class=byline><h3 property=dc.creator>By Jane Doe</div>'
+           '<div class=share>Share this story</div>'
+           '<div class=dateline><span datetitle=published '
+           'epochtime=1398960000000>May 1</div>'
+           '<div class=nav>Most read</div>'
+           '<div id=content><p>First para<p>Second para</div>'
+           '<div class=related>Related: buy stuff</div>'
+           '</body></html>')
+BLOG = ('<html><body><div class=title><h1 itemprop=headline>Blog post</div>'
+        '<div class=promo>Subscribe now</div>'
+        '<div class=byline><span itemprop=author>Jane Doe</div>'
+        '<div class=share>Share this story</div>'
+        '<div><span itemprop=datePublished content="2014-05-01T10:00:00-0400">'
+        'May 1</div><div class=nav>Most read</div>'
+        '<article itemprop=articleBody><p>First para<p>Second para</article>'
+        '<div class=related>Related: buy stuff</div>'
+        '</body></html>')
+JUNK = ['Subscribe', 'Share', 'Most read', 'buy stuff']
+
+def parse(parser, html, parse_only):
+    article = parser('http://www.washingtonpost.com/', fetch=False)
+    article.parse_only = parse_only
+    article.html = html
+    article.parse()
+    return article
+
+class ParseOnlyTest(unittest.TestCase):
+
+    def check(self, html):
+        whole = parse(washpo.WashPoParser, html, None)
+        strained = parse(washpo.WashPoParser, html,
+                         washpo.WashPoParser.parse_only)
+        self.assertTrue(strained.real_article)
+        self.assertEqual(unicode(whole), unicode(strained))
+        for junk in JUNK:
+            self.assertNotIn(junk, unicode(strained))
+
+    @unittest.skipIf(lxmlsoup.lxml is None, 'needs lxml')
+    def test_washpo_article(self):
+        self.check(ARTICLE)
+
+    @unittest.skipIf(lxmlsoup.lxml is None, 'needs lxml')
+    def test_washpo_blog(self):
+        self.check(BLOG)
+
+    def check_not_strained(self, beautifulsoup, **kwargs):
+        article = nyt.NYTParser('http://www.nytimes.com/', fetch=False)
+        article.parse_only = washpo.WashPoParser.parse_only
+        soup = article.make_soup(ARTICLE, beautifulsoup, **kwargs)
+        # Strained, the headline would run on into the promo
+        self.assertEqual(soup.find('h1').getText(), 'Headline')
+        self.assertEqual(soup.find('div', 'promo').getText(), 'Subscribe now')
+
+    def test_bs3_not_strained(self):
+        self.check_not_strained(BeautifulSoup)
+
+    def test_html_parser_not_strained(self):
+        self.check_not_strained(bs4.BeautifulSoup, features='html.parser')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,17 @@ class WashPoParser(BaseParser):
     feeder_pat   = '^https?://www.washingtonpost.com/.*_story.html|https?://www.washingtonpost.com/.*/wp/.*/'
     feeder_pages = ['http://www.washingtonpost.com/']
 
+    parse_only = [('meta', {}),
+                  ('h1', {'property': 'dc.title'}),
+                  ('h3', {'property': 'dc.creator'}),
+                  ('span', {'datetitle': 'published'}),
+                  ('div', {'id': 'content'}),
+                  # Blog posts
+                  ('h1', {'itemprop': 'headline'}),
+                  ('span', {'itemprop': 'author'}),
+                  ('span', {'itemprop': 'datePublished'}),
+                  ('article', {'itemprop': 'articleBody'})]
+
     def _printableurl(self):
         return re.sub('_story.html.*', '_print.html', self.url)
 
@@ -44,7 +55,7 @@ class WashPoParser(BaseParser):
         return True
 
     def _parse(self, html):
-        soup = BeautifulSoup(html)
+        soup = self.make_soup(html, BeautifulSoup)
 
         self.meta = soup.findAll('meta')
         elt = soup.find('h1', property="dc.title")
@@ -49,6 +49,8 @@ class diff_match_patch:
     self.Diff_Timeout = 1.0
     # Cost of an empty edit operation in terms of edit characters.
     self.Diff_EditCost = 4
+    # Characters diff_bisect compares at once along a long diagonal.
+    self.Diff_SnakeBlock = 16
     # How eagerly to 'split' an equality, absorbing it into neighboring
     # large changes.  (-infinity => compare equality to min of changes;
     # 0 => geometric mean; 1 => mean; infinity => max)
@@ -281,6 +283,10 @@ class diff_match_patch:
     # Cache the text lengths to prevent multiple calls.
     text1_length = len(text1)
     text2_length = len(text2)
+    # The reverse path reads the texts from the end.  Reversed copies let
+    # it read forwards, just like the front path.
+    rtext1 = text1[::-1]
+    rtext2 = text2[::-1]
     max_d = (text1_length + text2_length + 1) // 2
     v_offset = max_d
     v_length = 2 * max_d
@@ -297,24 +303,38 @@ class diff_match_patch:
     k1end = 0
     k2start = 0
     k2end = 0
+    block = self.Diff_SnakeBlock
     for d in xrange(max_d):
       # Bail out if deadline is reached.
       if time.time() > deadline:
         break
 
+      # The loops run over k_offset = v_offset + k, from low to high.
+      low = v_offset - d
+      high = v_offset + d
+
       # Walk the front path one step.
-      for k1 in xrange(-d + k1start, d + 1 - k1end, 2):
-        k1_offset = v_offset + k1
-        if k1 == -d or (k1 != d and
+      for k1_offset in xrange(low + k1start, high + 1 - k1end, 2):
+        if k1_offset == low or (k1_offset != high and
             v1[k1_offset - 1] < v1[k1_offset + 1]):
           x1 = v1[k1_offset + 1]
         else:
           x1 = v1[k1_offset - 1] + 1
-        y1 = x1 - k1
-        while (x1 < text1_length and y1 < text2_length and
-               text1[x1] == text2[y1]):
+        y1 = x1 - k1_offset + v_offset
+        if (x1 < text1_length and y1 < text2_length and
+            text1[x1] == text2[y1]):
+          # Follow the diagonal, a block at a time while it's long.
           x1 += 1
           y1 += 1
+          chunk = text1[x1:x1 + block]
+          while chunk and chunk == text2[y1:y1 + block]:
+            x1 += len(chunk)
+            y1 += len(chunk)
+            chunk = text1[x1:x1 + block]
+          while (x1 < text1_length and y1 < text2_length and
+                 text1[x1] == text2[y1]):
+            x1 += 1
+            y1 += 1
         v1[k1_offset] = x1
         if x1 > text1_length:
           # Ran off the right of the graph.
@@ -323,7 +343,7 @@ class diff_match_patch:
           # Ran off the bottom of the graph.
           k1start += 2
         elif front:
-          k2_offset = v_offset + delta - k1
+          k2_offset = v_offset + v_offset + delta - k1_offset
           if k2_offset >= 0 and k2_offset < v_length and v2[k2_offset] != -1:
             # Mirror x2 onto top-left coordinate system.
             x2 = text1_length - v2[k2_offset]
@@ -332,18 +352,26 @@ class diff_match_patch:
               return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
 
       # Walk the reverse path one step.
-      for k2 in xrange(-d + k2start, d + 1 - k2end, 2):
-        k2_offset = v_offset + k2
-        if k2 == -d or (k2 != d and
+      for k2_offset in xrange(low + k2start, high + 1 - k2end, 2):
+        if k2_offset == low or (k2_offset != high and
             v2[k2_offset - 1] < v2[k2_offset + 1]):
           x2 = v2[k2_offset + 1]
         else:
           x2 = v2[k2_offset - 1] + 1
-        y2 = x2 - k2
-        while (x2 < text1_length and y2 < text2_length and
-               text1[-x2 - 1] == text2[-y2 - 1]):
+        y2 = x2 - k2_offset + v_offset
+        if (x2 < text1_length and y2 < text2_length and
+            rtext1[x2] == rtext2[y2]):
           x2 += 1
           y2 += 1
+          chunk = rtext1[x2:x2 + block]
+          while chunk and chunk == rtext2[y2:y2 + block]:
+            x2 += len(chunk)
+            y2 += len(chunk)
+            chunk = rtext1[x2:x2 + block]
+          while (x2 < text1_length and y2 < text2_length and
+                 rtext1[x2] == rtext2[y2]):
+            x2 += 1
+            y2 += 1
         v2[k2_offset] = x2
         if x2 > text1_length:
           # Ran off the left of the graph.
@@ -352,7 +380,7 @@ class diff_match_patch:
           # Ran off the top of the graph.
           k2start += 2
         elif not front:
-          k1_offset = v_offset + delta - k2
+          k1_offset = v_offset + v_offset + delta - k2_offset
           if k1_offset >= 0 and k1_offset < v_length and v1[k1_offset] != -1:
             x1 = v1[k1_offset]
             y1 = v_offset + x1 - k1_offset
@@ -481,7 +509,37 @@ class diff_match_patch:
     pointermid = pointermax
     pointerstart = 0
     while pointermin < pointermid:
-      if text1[pointerstart:pointermid] == text2[pointerstart:pointermid]:
+      # startswith compares in place, copying only one side.
+      if text1.startswith(text2[pointerstart:pointermid], pointerstart):
+        pointermin = pointermid
+        pointerstart = pointermin
+      else:
+        pointermax = pointermid
+      pointermid = (pointermax - pointermin) // 2 + pointermin
+    return pointermid
+
+  def diff_commonPrefixAt(self, text1, start1, text2, start2):
+    """Determine the common prefix of text1[start1:] and text2[start2:],
+    without copying them.
+
+    Args:
+      text1: First string.
+      start1: Where to start in text1.
+      text2: Second string.
+      start2: Where to start in text2.
+
+    Returns:
+      The number of characters common to the start of each string.
+    """
+    pointermax = min(len(text1) - start1, len(text2) - start2)
+    if pointermax <= 0 or text1[start1] != text2[start2]:
+      return 0
+    pointermin = 0
+    pointermid = pointermax
+    pointerstart = 0
+    while pointermin < pointermid:
+      if text1.startswith(text2[start2 + pointerstart:start2 + pointermid],
+                          start1 + pointerstart):
         pointermin = pointermid
         pointerstart = pointermin
       else:
@@ -508,9 +566,42 @@ class diff_match_patch:
     pointermax = min(len(text1), len(text2))
     pointermid = pointermax
     pointerend = 0
+    text1_length = len(text1)
+    text2_length = len(text2)
+    while pointermin < pointermid:
+      # endswith compares in place, copying only one side.
+      if text1.endswith(text2[text2_length - pointermid:
+                              text2_length - pointerend],
+                        0, text1_length - pointerend):
+        pointermin = pointermid
+        pointerend = pointermin
+      else:
+        pointermax = pointermid
+      pointermid = (pointermax - pointermin) // 2 + pointermin
+    return pointermid
+
+  def diff_commonSuffixAt(self, text1, end1, text2, end2):
+    """Determine the common suffix of text1[:end1] and text2[:end2],
+    without copying them.
+
+    Args:
+      text1: First string.
+      end1: Where to end in text1.
+      text2: Second string.
+      end2: Where to end in text2.
+
+    Returns:
+      The number of characters common to the end of each string.
+    """
+    pointermax = min(end1, end2)
+    if pointermax <= 0 or text1[end1 - 1] != text2[end2 - 1]:
+      return 0
+    pointermin = 0
+    pointermid = pointermax
+    pointerend = 0
     while pointermin < pointermid:
-      if (text1[-pointermid:len(text1) - pointerend] ==
-          text2[-pointermid:len(text2) - pointerend]):
+      if text1.endswith(text2[end2 - pointermid:end2 - pointerend],
+                        0, end1 - pointerend):
         pointermin = pointermid
         pointerend = pointermin
       else:
@@ -600,23 +691,22 @@ class diff_match_patch:
         common middle.  Or None if there was no match.
       """
       seed = longtext[i:i + len(longtext) // 4]
-      best_common = ''
+      # Only the best match's pieces are cut out, once it's known.
+      best_length = 0
       j = shorttext.find(seed)
       while j != -1:
-        prefixLength = self.diff_commonPrefix(longtext[i:], shorttext[j:])
-        suffixLength = self.diff_commonSuffix(longtext[:i], shorttext[:j])
-        if len(best_common) < suffixLength + prefixLength:
-          best_common = (shorttext[j - suffixLength:j] +
-              shorttext[j:j + prefixLength])
-          best_longtext_a = longtext[:i - suffixLength]
-          best_longtext_b = longtext[i + prefixLength:]
-          best_shorttext_a = shorttext[:j - suffixLength]
-          best_shorttext_b = shorttext[j + prefixLength:]
+        prefixLength = self.diff_commonPrefixAt(longtext, i, shorttext, j)
+        suffixLength = self.diff_commonSuffixAt(longtext, i, shorttext, j)
+        if best_length < suffixLength + prefixLength:
+          best_length = suffixLength + prefixLength
+          best = (j, prefixLength, suffixLength)
         j = shorttext.find(seed, j + 1)
 
-      if len(best_common) * 2 >= len(longtext):
-        return (best_longtext_a, best_longtext_b,
-                best_shorttext_a, best_shorttext_b, best_common)
+      if best_length * 2 >= len(longtext):
+        (j, prefixLength, suffixLength) = best
+        return (longtext[:i - suffixLength], longtext[i + prefixLength:],
+                shorttext[:j - suffixLength], shorttext[j + prefixLength:],
+                shorttext[j - suffixLength:j + prefixLength])
       else:
         return None
 
@@ -0,0 +1,127 @@
+"""Rendered diffs between versions, kept so diffview needn't run git.
+
+Each DiffCache row holds the diff from one version to another, both as
+diff_match_patch's compact delta (enough to rebuild the diff from the
+first version's text) and as the HTML diffview shows.  The scraper
+stores the diff to each new version from the one before as it saves
+it; diffview stores any other pair the first time someone looks at it.
+
+Only the CACHE_SIZE most recently viewed diffs are kept; the scraper
+calls evict() now and then to drop the rest.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+
+import diff_match_patch
+import models
+
+logger = logging.getLogger(__name__)
+
+# Number of diffs to keep
+CACHE_SIZE = 50000
+# A viewed diff's last_used is only updated if it's older than this,
+# so that popular diffs don't cost a write on every view.
+TOUCH_INTERVAL = timedelta(hours=1)
+# Rows to delete per query in evict()
+EVICT_CHUNK_SIZE = 500
+
+# The HTML is what diff_prettyHtml in static/lib/diff_match_patch_uncompressed.js
+# makes, which diffview used to run in the browser: the Python module's
+# diff_prettyHtml is the upstream one, without the [...] for long
+# unchanged stretches.  The patterns are the JavaScript ones, whose "."
+# doesn't match any line terminator, so that (?:.|\n) stops at \r,
+# U+2028 and U+2029.
+_DOT = u'[^\n\r\u2028\u2029]'
+_ANY = u'[^\r\u2028\u2029]'
+_CONTEXT = re.compile(u'(\n\n%s*)\n\n%s*\n\n(%s*\n\n)' % (_DOT, _ANY, _DOT))
+_CONTEXT_END = re.compile(u'(\n\n%s*)\n\n%s*' % (_DOT, _ANY))
+
+def pretty_html(diffs):
+    """Return the HTML for a list of diff_match_patch diffs"""
+    fragments = []
+    for i, (op, data) in enumerate(diffs):
+        html = (data.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+                .replace(u'>', u'&gt;'))
+        if op == diff_match_patch.diff_match_patch.DIFF_EQUAL:
+            if i + 1 < len(diffs):
+                html = _CONTEXT.sub(u'\\1\n\n[...]\n\n\\2', html, 1)
+            else:
+                html = _CONTEXT_END.sub(u'\\1\n\n[...]', html, 1)
+            tag = u'span'
+        elif op == diff_match_patch.diff_match_patch.DIFF_INSERT:
+            tag = u'ins'
+        else:
+            tag = u'del'
+        fragments.append(u'<%s>%s</%s>' % (tag, html.replace(u'\n', u'<br>'),
+                                           tag))
+    return u''.join(fragments)
+
+def compute(text1, text2):
+    """Return (delta, html) for the diff from text1 to text2 (as stored)"""
+    dmp = diff_match_patch.diff_match_patch()
+    diffs = dmp.diff_main(text1.decode('utf8'), text2.decode('utf8'))
+    dmp.diff_cleanupSemantic(diffs)
+    return dmp.diff_toDelta(diffs), pretty_html(diffs)
+
+def store(v1, v2, text1, text2):
+    """Return the DiffCache row for v1 to v2, computing it if need be"""
+    delta, html = compute(text1, text2)
+    try:
+        entry, created = models.DiffCache.objects.get_or_create(
+            v1=v1, v2=v2,
+            defaults=dict(delta=delta, html=html, last_used=datetime.now()))
+    except models.IntegrityError:
+        # Another process stored the same diff since we looked
+        try:
+            entry = models.DiffCache.objects.get(v1=v1, v2=v2)
+        except models.DiffCache.DoesNotExist:
+            # Not visible to our transaction yet; it's the same diff
+            entry = models.DiffCache(v1=v1, v2=v2, delta=delta, html=html,
+                                     last_used=datetime.now())
+    return entry
+
+def get_html(v1, v2):
+    """Return the HTML for the diff from v1 to v2.
+
+    Only if the diff isn't stored already are the versions' texts read
+    from git.  Returns None if either can't be read.
+    """
+    try:
+        entry = models.DiffCache.objects.get(v1=v1, v2=v2)
+    except models.DiffCache.DoesNotExist:
+        texts = [v1.text(), v2.text()]
+        if None in texts:
+            return None
+        return store(v1, v2, *texts).html
+    now = datetime.now()
+    if entry.last_used < now - TOUCH_INTERVAL:
+        models.DiffCache.objects.filter(id=entry.id).update(last_used=now)
+    return entry.html
+
+def store_adjacent(version, text):
+    """Store the diff to a newly saved version from the one before.
+
+    That's the previous version diffview links it with, i.e. the
+    article's latest earlier non-boring version.  text is the new
+    version's text.
+    """
+    previous = list(version.article.versions().filter(
+        date__lt=version.date).order_by('-date')[:1])
+    if not previous:
+        return
+    previous_text = previous[0].text()
+    if previous_text is not None:
+        store(previous[0], version, previous_text, text)
+
+def evict():
+    """Delete all but the CACHE_SIZE most recently viewed diffs"""
+    old = models.DiffCache.objects.order_by('-last_used').values_list(
+        'id', flat=True)[CACHE_SIZE:]
+    ids = list(old)
+    for i in range(0, len(ids), EVICT_CHUNK_SIZE):
+        models.DiffCache.objects.filter(
+            id__in=ids[i:i+EVICT_CHUNK_SIZE]).delete()
+    if ids:
+        logger.info('Dropped %s of the stored diffs', len(ids))
@@ -0,0 +1,140 @@
+"""Housekeeping for the monthly article repos.
+
+Each run of the scraper adds loose objects (or, with --git-pipeline,
+small packs) to the repos.  maintain_repos() tidies them up a bit at a
+time: it looks at every repo, works on the untidiest first, and stops
+starting new work once its time budget is spent.  For each repo it
+
+ - packs loose objects into a new pack (`git repack -d -l`), without
+   rewriting the existing packs,
+ - lets `git gc --auto` consolidate packs once there are too many,
+ - refreshes the commit-graph file, which speeds up rev-list and log.
+
+MaintenanceThread does this in the background, so the scraper can get
+on with checking articles.
+"""
+
+import logging
+import subprocess
+import threading
+import time
+
+GIT_PROGRAM = 'git'
+
+# Pack loose objects once a repo has this many
+LOOSE_OBJECT_LIMIT = 1000
+# Have gc --auto consolidate packs once there are more than this many
+PACK_LIMIT = 20
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+def repo_stats(git_dir):
+    """Return the numbers from `git count-objects -v` as a dict.
+
+    The interesting ones are 'count' (loose objects), 'packs', and
+    'size' and 'size-pack' (in KiB).
+    """
+    output = subprocess.check_output([GIT_PROGRAM, 'count-objects', '-v'],
+                                     cwd=git_dir)
+    stats = {}
+    for line in output.splitlines():
+        key, value = line.split(':', 1)
+        try:
+            stats[key] = int(value)
+        except ValueError:
+            pass
+    return stats
+
+def format_stats(stats):
+    return '%s loose objects (%s KiB), %s packs (%s KiB)' % (
+        stats.get('count'), stats.get('size'),
+        stats.get('packs'), stats.get('size-pack'))
+
+def maintenance_steps(stats):
+    """Return the git commands worth running on a repo with these stats"""
+    steps = []
+    if stats.get('count', 0) >= LOOSE_OBJECT_LIMIT:
+        steps.append(['repack', '-d', '-l', '-q'])
+    if stats.get('packs', 0) > PACK_LIMIT:
+        # Don't let gc wander off into the background, out of our budget
+        steps.append(['-c', 'gc.autoPackLimit=%d' % PACK_LIMIT,
+                      '-c', 'gc.autoDetach=false',
+                      'gc', '--auto', '--quiet'])
+    if steps:
+        steps.append(['commit-graph', 'write', '--reachable', '--split'])
+    return steps
+
+def maintain_repos(git_dirs, budget, first=None):
+    """Run maintenance on git_dirs for up to about budget seconds.
+
+    The repo first (e.g. this month's) goes first; the rest are done
+    in order of how many loose objects and packs they have.  A step
+    that is already running when the budget runs out is allowed to
+    finish.  Return {git_dir: stats after maintenance} for the repos
+    that were worked on.
+    """
+    deadline = time.time() + budget
+    all_stats = {}
+    for git_dir in git_dirs:
+        try:
+            all_stats[git_dir] = repo_stats(git_dir)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error('Unable to get object counts for %s: %s',
+                         git_dir, e)
+
+    def untidiness(git_dir):
+        stats = all_stats[git_dir]
+        return (git_dir == first,
+                stats.get('count', 0) + 100 * stats.get('packs', 0))
+    todo = sorted(all_stats, key=untidiness, reverse=True)
+    logger.info('Git repos: %s loose objects, %s packs in %s repos',
+                sum(stats.get('count', 0) for stats in all_stats.values()),
+                sum(stats.get('packs', 0) for stats in all_stats.values()),
+                len(all_stats))
+
+    results = {}
+    for git_dir in todo:
+        steps = maintenance_steps(all_stats[git_dir])
+        if not steps:
+            continue
+        logger.info('Maintaining %s: %s', git_dir,
+                    format_stats(all_stats[git_dir]))
+        for step in steps:
+            if time.time() >= deadline:
+                logger.info('Out of time for git maintenance')
+                return results
+            try:
+                subprocess.check_output([GIT_PROGRAM] + step, cwd=git_dir,
+                                        stderr=subprocess.STDOUT)
+            except subprocess.CalledProcessError as e:
+                # commit-graph needs a newer git than we may have; the
+                # other steps failing is worth hearing about.
+                if step[0] == 'commit-graph':
+                    log = logger.info
+                else:
+                    log = logger.warning
+                log('git %s failed in %s: %r', ' '.join(step), git_dir,
+                    e.output)
+        results[git_dir] = repo_stats(git_dir)
+        logger.info('Maintained %s: %s', git_dir,
+                    format_stats(results[git_dir]))
+    return results
+
+class MaintenanceThread(threading.Thread):
+    """Run maintain_repos in the background"""
+
+    def __init__(self, git_dirs, budget, first=None):
+        threading.Thread.__init__(self, name='git-maintenance')
+        self.daemon = True
+        self.args = (git_dirs, budget, first)
+        self.results = None
+
+    def run(self):
+        start_time = time.time()
+        try:
+            self.results = maintain_repos(*self.args)
+        except Exception:
+            logger.exception('Error during git maintenance')
+        logger.info('Git maintenance finished in %.1f seconds',
+                    time.time() - start_time)
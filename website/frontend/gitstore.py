@@ -0,0 +1,460 @@
+"""Long-lived git processes for reading and writing the article repos.
+
+Storing a version through the git command line takes half a dozen
+forks (show, hash-object, an ls-tree per old version, add, commit,
+rev-list), which dominates the scraper's running time.  A GitStore
+instead keeps a single `git fast-import` process open per repo and
+does everything through it:
+
+ - reads use its `ls` and `cat-blob` commands,
+ - writes send the file contents inline with a `commit` command,
+ - the new commit ID comes back from `get-mark`.
+
+Commits written this way only become visible to other git processes
+(e.g. Version.text() on the website) at the next checkpoint, so the
+caller should not publish a commit ID before then; see
+after_checkpoint().
+
+The index and working tree of the repo are not touched, except that
+close() resets the index to match the new HEAD.
+"""
+
+import collections
+import hashlib
+import os
+import subprocess
+import threading
+import time
+
+GIT_PROGRAM = 'git'
+
+class GitError(Exception):
+    pass
+
+def blob_hash(data):
+    """Return the SHA1 git would give data stored as a blob"""
+    return hashlib.sha1('blob %d\0' % len(data) + data).hexdigest()
+
+def read_head(git_dir):
+    """Return (refname, commit) for HEAD of git_dir, without running git.
+
+    refname is None if HEAD is detached; commit is None if the branch
+    has no commits yet.
+    """
+    dotgit = os.path.join(git_dir, '.git')
+    head = open(os.path.join(dotgit, 'HEAD')).read().strip()
+    if not head.startswith('ref: '):
+        return None, head
+    ref = head[len('ref: '):]
+    try:
+        return ref, open(os.path.join(dotgit, ref)).read().strip()
+    except IOError:
+        pass
+    # After a gc, refs live in packed-refs instead
+    try:
+        for line in open(os.path.join(dotgit, 'packed-refs')):
+            fields = line.split()
+            if len(fields) == 2 and fields[1] == ref:
+                return ref, fields[0]
+    except IOError:
+        pass
+    return ref, None
+
+class GitStore(object):
+    """A `git fast-import` process writing to the current branch of git_dir.
+
+    Safe to use from several threads, although the scraper only writes
+    from one.
+    """
+
+    def __init__(self, git_dir, checkpoint_every=100):
+        self.git_dir = git_dir
+        self.checkpoint_every = checkpoint_every
+        self.ref, self.head = read_head(git_dir)
+        if self.ref is None:
+            raise GitError('HEAD of %s is detached' % git_dir)
+        self.process = None
+        self.lock = threading.RLock()
+        self.next_mark = 1
+        # fast-import only accepts commits it hasn't written out yet by
+        # mark, so remember the marks of the ones we made.
+        self.marks = {}
+        self.uncheckpointed = 0
+        self.callbacks = []
+
+    def _start(self):
+        # Ask once for the committer, rather than on every commit
+        ident = subprocess.check_output([GIT_PROGRAM, 'var',
+                                         'GIT_COMMITTER_IDENT'],
+                                        cwd=self.git_dir).strip()
+        self.committer = ident.rsplit(' ', 2)[0]
+        # With --done, fast-import throws everything away if we die
+        # without saying goodbye, rather than updating the branch.
+        self.process = subprocess.Popen([GIT_PROGRAM, 'fast-import',
+                                         '--quiet', '--done'],
+                                        cwd=self.git_dir,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+
+    def _send(self, command):
+        if self.process is None:
+            self._start()
+        try:
+            self.process.stdin.write(command)
+            self.process.stdin.flush()
+        except IOError as e:
+            raise GitError('git fast-import in %s died: %s'
+                           % (self.git_dir, e))
+
+    def _readline(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise GitError('git fast-import in %s died' % self.git_dir)
+        return line
+
+    def ls(self, commit, path):
+        """Return the blob SHA1 of path in commit, or None if it's absent"""
+        with self.lock:
+            commit = self.marks.get(commit, commit)
+            self._send('ls %s %s\n' % (commit, path))
+            line = self._readline()
+        if line.startswith('missing '):
+            return None
+        # <mode> SP <type> SP <sha> HT <path>
+        return line.split('\t', 1)[0].split()[2]
+
+    def cat_blob(self, sha):
+        """Return the contents of the blob sha"""
+        with self.lock:
+            self._send('cat-blob %s\n' % sha)
+            header = self._readline().split()
+            if header[1] == 'missing':
+                raise GitError('blob %s missing in %s' % (sha, self.git_dir))
+            size = int(header[2])
+            data = self.process.stdout.read(size + 1)
+        return data[:size]
+
+    def blob(self, path, commit=None):
+        """Return the blob SHA1 of path in commit (default: HEAD)"""
+        commit = commit or self.head
+        if commit is None:
+            return None
+        return self.ls(commit, path)
+
+    def read(self, path, commit=None):
+        """Return the contents of path in commit (default: HEAD), or None"""
+        sha = self.blob(path, commit)
+        if sha is None:
+            return None
+        return self.cat_blob(sha)
+
+    def commit(self, files, message):
+        """Commit files, a list of (path, data), on top of HEAD.
+
+        Return the new commit ID.
+        """
+        with self.lock:
+            if self.process is None:
+                self._start()
+            mark = self.next_mark
+            self.next_mark += 1
+            parts = ['commit %s\n' % self.ref,
+                     'mark :%d\n' % mark,
+                     'committer %s %d %s\n' % (self.committer, time.time(),
+                                               time.strftime('%z')),
+                     'data %d\n%s\n' % (len(message), message)]
+            if self.head is not None:
+                parts.append('from %s\n' % self.marks.get(self.head,
+                                                          self.head))
+            for path, data in files:
+                parts.append('M 100644 inline %s\n' % path)
+                parts.append('data %d\n%s\n' % (len(data), data))
+            parts.append('\n')
+            parts.append('get-mark :%d\n' % mark)
+            self._send(''.join(parts))
+            self.head = self._readline().strip()
+            self.marks[self.head] = ':%d' % mark
+            self.uncheckpointed += 1
+            if self.uncheckpointed >= self.checkpoint_every:
+                self.checkpoint()
+            return self.head
+
+    def after_checkpoint(self, callback):
+        """Call callback() once the commits so far are visible in the repo"""
+        with self.lock:
+            if self.uncheckpointed:
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def checkpoint(self):
+        """Write out pending objects and update the branch"""
+        with self.lock:
+            if self.process is None:
+                return
+            self._send('checkpoint\nprogress checkpoint\n')
+            # The progress line only arrives once the checkpoint is done
+            self._readline()
+            self.uncheckpointed = 0
+            callbacks, self.callbacks = self.callbacks, []
+            # If someone else committed to the branch since we started,
+            # fast-import just warns and leaves the branch alone, and
+            # our commits are unreachable.  Don't publish them.
+            if self.head is not None and read_head(self.git_dir)[1] != self.head:
+                self._abandon()
+                raise GitError('%s in %s moved under git fast-import; '
+                               'dropped %d waiting updates'
+                               % (self.ref, self.git_dir, len(callbacks)))
+        for callback in callbacks:
+            callback()
+
+    def _abandon(self):
+        """Kill fast-import and start afresh from the branch as it is now"""
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+        self.next_mark = 1
+        self.marks = {}
+        self.uncheckpointed = 0
+        self.callbacks = []
+        self.ref, self.head = read_head(self.git_dir)
+
+    def close(self):
+        """Finish writing and stop the fast-import process"""
+        with self.lock:
+            if self.process is None:
+                return
+            self.checkpoint()
+            self._send('done\n')
+            self.process.stdin.close()
+            self.process.stdout.close()
+            returncode = self.process.wait()
+            self.process = None
+            if returncode:
+                raise GitError('git fast-import in %s exited with %s'
+                               % (self.git_dir, returncode))
+            # Bring the index in line with what we committed, so that
+            # `git status` and plain `git commit` keep making sense.
+            subprocess.check_output([GIT_PROGRAM, 'read-tree', 'HEAD'],
+                                    cwd=self.git_dir)
+
+class CatFile(object):
+    """`git cat-file` processes for looking up and reading objects.
+
+    info() uses a `--batch-check` process and read() a `--batch` one,
+    each started on first use.  Only sees what is already written to
+    the repo, so it must not be used for commits still pending in a
+    GitStore.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.lock = threading.Lock()
+        self.process = None
+        self.read_lock = threading.Lock()
+        self.read_process = None
+
+    def info(self, rev):
+        """Return (sha, type, size) for rev, e.g. 'commit:path', or None"""
+        with self.lock:
+            if self.process is None:
+                self.process = subprocess.Popen([GIT_PROGRAM, 'cat-file',
+                                                 '--batch-check'],
+                                                cwd=self.git_dir,
+                                                stdin=subprocess.PIPE,
+                                                stdout=subprocess.PIPE)
+            self.process.stdin.write(rev + '\n')
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        if not line:
+            raise GitError('git cat-file in %s died' % self.git_dir)
+        fields = line.split()
+        if fields[-1] == 'missing' or len(fields) != 3:
+            return None
+        return fields[0], fields[1], int(fields[2])
+
+    def blob(self, commit, path):
+        """Return the blob SHA1 of path in commit, or None"""
+        info = self.info('%s:%s' % (commit, path))
+        if info is None or info[1] != 'blob':
+            return None
+        return info[0]
+
+    def read(self, rev):
+        """Return the contents of the blob rev, e.g. 'commit:path', or None"""
+        with self.read_lock:
+            if self.read_process is None:
+                self.read_process = subprocess.Popen([GIT_PROGRAM, 'cat-file',
+                                                      '--batch'],
+                                                     cwd=self.git_dir,
+                                                     stdin=subprocess.PIPE,
+                                                     stdout=subprocess.PIPE)
+            process = self.read_process
+            try:
+                process.stdin.write(rev + '\n')
+                process.stdin.flush()
+                line = process.stdout.readline()
+                fields = line.split()
+                if len(fields) == 3:
+                    size = int(fields[2])
+                    data = process.stdout.read(size + 1)
+                    if len(data) != size + 1:
+                        line = ''
+            except IOError:
+                line = ''
+            if not line:
+                # Start afresh next time
+                self.read_process = None
+                raise GitError('git cat-file in %s died' % self.git_dir)
+        if len(fields) != 3 or fields[1] != 'blob':
+            return None
+        return data[:size]
+
+    def close(self):
+        with self.lock:
+            if self.process is not None:
+                self.process.stdin.close()
+                self.process.wait()
+                self.process = None
+        with self.read_lock:
+            if self.read_process is not None:
+                self.read_process.stdin.close()
+                self.read_process.wait()
+                self.read_process = None
+
+# Most bytes of file contents for a BlobCache to hold
+BLOB_CACHE_BYTES = 32 * 1024 * 1024
+# Most repos for a BlobCache to keep `git cat-file` processes open in
+BLOB_CACHE_READERS = 8
+
+class BlobCache(object):
+    """File contents read through a CatFile per repo, with the most
+    recently used kept in memory, up to max_bytes of them.  Only the
+    max_readers most recently read repos keep their CatFile open.
+
+    Keyed by repo and rev, so revs should name fixed contents: a blob
+    SHA1 or 'commit:path', not 'HEAD:path'.  Safe to use from several
+    threads.
+    """
+
+    def __init__(self, max_bytes=BLOB_CACHE_BYTES,
+                 max_readers=BLOB_CACHE_READERS):
+        self.max_bytes = max_bytes
+        self.max_readers = max_readers
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # oldest first
+        self.size = 0
+        self.readers = collections.OrderedDict()  # oldest first
+        # Threads reading through each CatFile, which mustn't be closed
+        # under them; evicted ones still in use are closed by the last.
+        self.users = {}
+        self.evicted = set()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, git_dir, rev):
+        """Return the contents of the blob rev in git_dir, or None"""
+        key = (git_dir, rev)
+        with self.lock:
+            data = self.entries.pop(key, None)
+            if data is not None:
+                self.entries[key] = data
+                self.hits += 1
+                return data
+            self.misses += 1
+            reader = self.readers.pop(git_dir, None) or CatFile(git_dir)
+            self.readers[git_dir] = reader
+            self.users[reader] = self.users.get(reader, 0) + 1
+            to_close = []
+            while len(self.readers) > self.max_readers:
+                old_dir, old_reader = self.readers.popitem(last=False)
+                if old_reader in self.users:
+                    self.evicted.add(old_reader)
+                else:
+                    to_close.append(old_reader)
+        for old_reader in to_close:
+            old_reader.close()
+        try:
+            try:
+                data = reader.read(rev)
+            except GitError:
+                # Perhaps killed, or the repo was moved; try once more
+                data = reader.read(rev)
+        finally:
+            self._release(reader)
+        # Not remembering misses, which may be commits yet to be written
+        if data is None or len(data) > self.max_bytes:
+            return data
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = data
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    old_key, old_data = self.entries.popitem(last=False)
+                    self.size -= len(old_data)
+        return data
+
+    def _release(self, reader):
+        """Done reading through reader; close it if it was evicted"""
+        with self.lock:
+            self.users[reader] -= 1
+            if self.users[reader]:
+                return
+            del self.users[reader]
+            if reader not in self.evicted:
+                return
+            self.evicted.remove(reader)
+        reader.close()
+
+    def close(self):
+        """Stop the cat-file processes and forget everything read.
+
+        Readers in use are left to be closed by their last thread.
+        """
+        with self.lock:
+            readers = [reader for reader in self.readers.values()
+                       if reader not in self.users]
+            self.evicted.update(reader for reader in self.readers.values()
+                                if reader in self.users)
+            self.readers = collections.OrderedDict()
+            self.entries.clear()
+            self.size = 0
+        for reader in readers:
+            reader.close()
+
+# Shared by Version.text()
+blob_cache = BlobCache()
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(git_dir):
+    """Return the shared GitStore for git_dir, creating it if needed"""
+    with _stores_lock:
+        if git_dir not in _stores:
+            _stores[git_dir] = GitStore(git_dir)
+        return _stores[git_dir]
+
+def close_all():
+    """Close every GitStore opened by get_store"""
+    with _stores_lock:
+        stores = _stores.values()
+        _stores.clear()
+    _each(stores, GitStore.close)
+
+def checkpoint_all():
+    """Make the commits so far in every open GitStore visible"""
+    with _stores_lock:
+        stores = _stores.values()
+    _each(stores, GitStore.checkpoint)
+
+def _each(stores, method):
+    """Call method on every store, then raise the first GitError if any"""
+    error = None
+    for store in stores:
+        try:
+            method(store)
+        except GitError as e:
+            error = error or e
+    if error is not None:
+        raise error
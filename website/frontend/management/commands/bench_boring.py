@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+from frontend import models
+import time
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+import scraper
+from parsers.baseparser import canonicalize
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--articles',
+            type='int',
+            default=200,
+            help='Use the versions of this many recently changed articles'),
+        make_option('--repeat',
+            type='int',
+            default=3,
+            help='Time each check this many times and keep the best'),
+        )
+    help = '''Time the scraper's boring-change check on stored versions.
+
+Compares scraper.is_boring with the check as it was before it compared
+words as bytes, on each pair of consecutive versions of the articles
+that changed most recently, and reports any pairs where they disagree.
+'''.strip()
+
+    def handle(self, *args, **options):
+        histories = load_histories(options['articles'])
+        pairs = [(old, new) for texts in histories
+                 for old, new in zip(texts, texts[1:])]
+        if not pairs:
+            print 'No versions to compare'
+            return
+        print '%d pairs of versions from %d articles' % (len(pairs),
+                                                         len(histories))
+
+        def time_check(check):
+            best = None
+            for i in range(options['repeat']):
+                start = time.time()
+                results = [check(old, new) for old, new in pairs]
+                elapsed = time.time() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            return best, results
+
+        before, expected = time_check(reference_is_boring)
+        after, results = time_check(scraper.is_boring)
+
+        # As in cleanup.mark_boring, summarizing each text once for
+        # both pairs it's in
+        start = time.time()
+        summaries = dict((text, scraper.TextSummary(text))
+                         for texts in histories for text in texts)
+        summarize_time = time.time() - start
+        reuse, reuse_results = time_check(
+            lambda old, new: scraper.boring_change(summaries[old],
+                                                   summaries[new]))
+        reuse += summarize_time
+
+        print '%-28s %8.3f ms/pair' % ('before', before * 1000 / len(pairs))
+        for name, elapsed in (('is_boring', after),
+                              ('summarizing each text once', reuse)):
+            print '%-28s %8.3f ms/pair (%.1fx)' % (
+                name, elapsed * 1000 / len(pairs), before / elapsed)
+        print '%d of the pairs are boring' % sum(expected)
+        for (old, new), a, b, c in zip(pairs, expected, results,
+                                       reuse_results):
+            if not a == b == c:
+                print 'DISAGREE: before %s, now %s:' % (a, b)
+                print '  %r' % old[:200]
+                print '  %r' % new[:200]
+
+def load_histories(num_articles):
+    """Return [[text of each version]] for recently changed articles"""
+    articles = models.Article.objects.order_by('-last_update')[:num_articles]
+    histories = []
+    for article in articles:
+        texts = [v.text() for v in article.versions()]
+        texts = [text for text in texts if text is not None]
+        if len(texts) >= 2:
+            histories.append(texts)
+    return histories
+
+def reference_is_boring(old, new):
+    """scraper.is_boring as it was, decoding and splitting both texts"""
+    oldu = canonicalize(old.decode('utf8'))
+    newu = canonicalize(new.decode('utf8'))
+
+    if scraper.extra_canonical(oldu) == scraper.extra_canonical(newu):
+        return True
+
+    for charset in scraper.CHARSET_LIST:
+        try:
+            if oldu.encode(charset) == new:
+                return True
+        except UnicodeEncodeError:
+            pass
+    return False
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+import imp
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+import diff_match_patch
+from bench_boring import load_histories
+import scraper
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--articles',
+            type='int',
+            default=200,
+            help='Use the versions of this many recently changed articles'),
+        make_option('--repeat',
+            type='int',
+            default=3,
+            help='Time each diff this many times and keep the best'),
+        make_option('--reference',
+            default=None,
+            help='Another diff_match_patch.py to compare with, e.g. from '
+                 '`git show <commit>:website/diff_match_patch.py`'),
+        )
+    help = '''Time diff_match_patch on stored versions.
+
+Runs diff_main and diff_cleanupSemantic, as the scraper does, on each
+pair of consecutive versions of the articles that changed most
+recently.  With --reference, does the same with another copy of the
+module, and reports any pairs where the two diffs differ.
+'''.strip()
+
+    def handle(self, *args, **options):
+        histories = load_histories(options['articles'])
+        pairs = [(old, new) for texts in histories
+                 for old, new in zip(texts, texts[1:])]
+        if not pairs:
+            print 'No versions to compare'
+            return
+        print '%d pairs of versions from %d articles' % (len(pairs),
+                                                         len(histories))
+
+        modules = [('diff_match_patch', diff_match_patch)]
+        if options['reference']:
+            try:
+                reference = imp.load_source('reference_diff_match_patch',
+                                            options['reference'])
+            except IOError as e:
+                raise CommandError(str(e))
+            modules.insert(0, ('reference', reference))
+
+        results = []
+        for name, module in modules:
+            for checklines in (True, False):
+                elapsed, diffs = time_diffs(module, pairs, checklines,
+                                            options['repeat'])
+                print '%-18s checklines=%-5s %8.2f ms/pair' % (
+                    name, checklines, elapsed * 1000 / len(pairs))
+                results.append(diffs)
+
+        if len(modules) == 2:
+            half = len(results) // 2
+            for before, after in zip(results[:half], results[half:]):
+                for (old, new), a, b in zip(pairs, before, after):
+                    if a != b:
+                        print 'DIFFERENT DIFF:'
+                        print '  %r' % old[:200]
+                        print '  %r' % new[:200]
+
+def time_diffs(module, pairs, checklines, repeat):
+    """Return (best seconds for all pairs, [diff of each pair])"""
+    best = None
+    for i in range(repeat):
+        diffs = []
+        start = time.time()
+        for old, new in pairs:
+            dmp = module.diff_match_patch()
+            dmp.Diff_Timeout = scraper.DIFF_TIMEOUT
+            diff = dmp.diff_main(old, new, checklines)
+            dmp.diff_cleanupSemantic(diff)
+            diffs.append(diff)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, diffs
@@ -3,7 +3,7 @@
 import sys
 import subprocess
 import os
-from frontend import models
+from frontend import gitstore, models
 from datetime import datetime, timedelta
 import traceback
 import time
@@ -28,6 +28,10 @@ class Command(BaseCommand):
             action='store_true',
             default=False,
             help='Look through versions to mark boring ones'),
+        make_option('--backfill-blobs',
+            action='store_true',
+            default=False,
+            help='Record the file hash of versions stored without one'),
         )
     help = '''Modify versions in git repo
 
@@ -38,6 +42,8 @@ scanned them recently, unless --all is passed.
     def handle(self, *args, **options):
         if options['migrate']:
             migrate_versions()
+        if options['backfill_blobs']:
+            backfill_blobs()
         if options['remove_duplicates']:
             remove_duplicates()
         if options['mark_boring']:
@@ -142,13 +148,40 @@ def check_output(*popenargs, **kwargs):
 if not hasattr(subprocess, 'check_output'):
     subprocess.check_output = check_output
 
-def get_hash(version, filename):
+def get_hash(version, filename, git_dir):
     """Return the SHA1 hash of filename in a given version"""
     output = subprocess.check_output([GIT_PROGRAM, 'ls-tree', '-r',
                                       version, filename],
-                                     cwd=models.GIT_DIR)
+                                     cwd=git_dir)
     return output.split()[2]
 
+def backfill_blobs(chunk_size=1000):
+    """Fill in Version.blob for versions stored before it existed"""
+    query = models.Version.objects.filter(blob__isnull=True)
+    num_versions = query.count()
+    readers = {}
+    last_id = 0
+    done = 0
+    while True:
+        versions = list(query.filter(id__gt=last_id).order_by('id')
+                        .select_related('article')[:chunk_size])
+        if not versions:
+            break
+        for v in versions:
+            git_dir = v.article.full_git_dir
+            if git_dir not in readers:
+                readers[git_dir] = gitstore.CatFile(git_dir)
+            blob = readers[git_dir].blob(v.v, v.article.filename())
+            if blob is None:
+                print 'ERROR: missing', v.article.url, v.v
+                continue
+            models.Version.objects.filter(id=v.id).update(blob=blob)
+        last_id = versions[-1].id
+        done += len(versions)
+        print '%s/%s' % (done, num_versions)
+    for reader in readers.values():
+        reader.close()
+
 def remove_duplicates():
     num_articles = models.Article.objects.count()
     for i, article in enumerate(models.Article.objects.all()):
@@ -160,7 +193,7 @@ def remove_duplicates():
         if len(versions) <= 3:
             continue
         for v in versions:
-            h = get_hash(v.v, filename)
+            h = v.blob or get_hash(v.v, filename, article.full_git_dir)
             mapping[h] = mapping.get(h, 0) + 1
             if mapping[h] > 2:
                 print article.url, 'should be boring', v.v, len(versions)
@@ -185,13 +218,18 @@ def mark_boring():
                 v.delete()
                 reload = True
         if reload:
-            texts = [(v, v.text()) for v in versions if v.text()]
+            texts = [(v, text) for v, text in texts if text]
 
-        for (old, oldtxt), (new, newtxt) in zip(texts, texts[1:]):
-            if scraper.is_boring(oldtxt, newtxt):
+        # Summarized once each, for both pairs a text is in
+        summaries = [(v, scraper.TextSummary(text)) for v, text in texts]
+        for (old, oldsum), (new, newsum) in zip(summaries, summaries[1:]):
+            if scraper.boring_change(oldsum, newsum):
                 print 'Boring: %s %s %s' % (article.url, old.v, new.v)
                 new.boring = True
                 new.save()
+    cache = gitstore.blob_cache
+    print 'Read %s texts from git and %s from memory' % (cache.misses,
+                                                         cache.hits)
 
 legacy_bad_commit_range = (datetime(2012, 7, 8, 4, 0),
                            datetime(2012, 7, 8, 8, 0))
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+from datetime import datetime, timedelta
+from frontend import models, recheck
+import math
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--days',
+            type='int',
+            default=90,
+            help='Replay articles first seen in the last DAYS days'),
+        make_option('--limit',
+            type='int',
+            default=2000,
+            help='Replay at most this many articles'),
+        make_option('--factor',
+            type='float',
+            default=None,
+            help='Expected changes per check for the adaptive schedule '
+                 '(default: whatever makes as many checks as the fixed '
+                 'schedule)'),
+        )
+    help = '''Compare check schedules on the versions we have stored.
+
+Replays each article's history under the fixed schedule and under the
+adaptive one used with `scraper --fetch-budget`, and reports how many
+checks each spends and how many versions it catches.
+
+The history was itself collected on the fixed schedule, so versions
+that schedule missed are missing here too; the comparison is tilted
+in its favour.
+'''.strip()
+
+    def handle(self, *args, **options):
+        histories = load_histories(options['days'], options['limit'])
+        total = sum(len(changes) for changes, first_seen, end in histories)
+        print 'Replaying %s articles with %s versions' % (len(histories),
+                                                          total)
+
+        def fixed(last_check, last_update, first_seen, change_score):
+            return models.next_check_time(last_check, last_update)
+        checks, caught = replay_all(histories, fixed)
+        report('fixed', checks, caught, total)
+
+        factor = options['factor']
+        if factor is None:
+            factor = matching_factor(histories, checks)
+        policy = recheck.AdaptivePolicy(factor)
+        checks, caught = replay_all(histories, policy.next_check_time)
+        report('adaptive (%.3f changes/check)' % factor, checks, caught,
+               total)
+
+def load_histories(days, limit):
+    """Return [(version times, first seen, end of replay)] for articles"""
+    now = datetime.now()
+    articles = models.Article.objects.exclude(git_dir='old').filter(
+        initial_date__gt=now - timedelta(days=days)).order_by('-id')
+    histories = []
+    for article_id, initial_date in articles.values_list(
+            'id', 'initial_date')[:limit]:
+        changes = list(models.Version.objects.filter(
+                article=article_id, boring=False).order_by('date')
+                       .values_list('date', flat=True))
+        if not changes:
+            continue
+        first_seen = min(initial_date, changes[0])
+        histories.append((changes, first_seen,
+                          min(now, first_seen + recheck.MAX_AGE)))
+    return histories
+
+def replay_all(histories, next_check_time):
+    checks = caught = 0
+    for changes, first_seen, end in histories:
+        c, v = recheck.replay(changes, first_seen, end, next_check_time)
+        checks += c
+        caught += v
+    return checks, caught
+
+def matching_factor(histories, target_checks, steps=30):
+    """Return the factor making about target_checks checks"""
+    low, high = math.log(1e-4), math.log(10.)
+    for i in range(steps):
+        mid = (low + high) / 2
+        policy = recheck.AdaptivePolicy(math.exp(mid))
+        checks, caught = replay_all(histories, policy.next_check_time)
+        # Fewer checks with a bigger factor
+        if checks > target_checks:
+            low = mid
+        else:
+            high = mid
+    return math.exp(high)
+
+def report(name, checks, caught, total):
+    print '%s: %s checks, caught %s of %s versions (%.1f%%), %.4f per check' % (
+        name, checks, caught, total, 100. * caught / max(total, 1),
+        float(caught) / max(checks, 1))
@@ -2,29 +2,41 @@
 
 from datetime import datetime, timedelta
 import errno
-from frontend import models
+from frontend import diffcache, gitmaint, gitstore, models, recheck
+import heapq
 import httplib
 import logging
+import multiprocessing
 import os
+import Queue
+import re
+import signal
 import smtplib
 import subprocess
 import sys
 import textwrap
+import threading
 import time
 import traceback
 import urllib2
 
 import diff_match_patch
+try:
+    import fast_diff_match_patch
+except ImportError:
+    fast_diff_match_patch = None
 
 import parsers
+from parsers import baseparser, httpclient, ratelimit, retry
 from parsers.baseparser import canonicalize, formatter, logger
 
 from website import settings
 
 GIT_PROGRAM = 'git'
 ERROR_FILE_PATH = '/tmp/newsdiffs_logging_errs'
+HTTP_CACHE_PATH = '/tmp/newsdiffs_http_cache'
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db.models import Q
 from optparse import make_option
 
@@ -38,6 +50,95 @@ class Command(BaseCommand):
             action='store_true',
             default=False,
             help='Update _all_ stored articles'),
+        make_option('--workers',
+            type='int',
+            default=1,
+            help='Number of pages to download at once'),
+        make_option('--parse-workers',
+            type='int',
+            default=1,
+            help='Number of downloaded articles to parse at once'),
+        make_option('--html-backend',
+            default=None,
+            help='Build HTML trees with this ("lxml") in the parsers '
+                 'that support it, rather than BeautifulSoup'),
+        make_option('--parse-processes',
+            action='store_true',
+            default=False,
+            help='Parse in --parse-workers separate processes, to use '
+                 'more than one core'),
+        make_option('--diff-engine',
+            default='lines',
+            help='How to count the characters changed in a new version: '
+                 '"lines" (diff changed paragraphs only) or "chars" (diff '
+                 'the whole text)'),
+        make_option('--per-domain',
+            type='int',
+            default=2,
+            help='Maximum parallel fetches from any one domain'),
+        make_option('--git-pipeline',
+            action='store_true',
+            default=False,
+            help='Store versions through a long-running git fast-import '
+                 'process per repo instead of running git for each step'),
+        make_option('--batch-commit',
+            action='store_true',
+            default=False,
+            help='Make one git commit per repo for the whole run, rather '
+                 'than one per changed article'),
+        make_option('--http-pool-size',
+            type='int',
+            default=httpclient.POOL_SIZE,
+            help='Keep-alive connections to keep open per site'),
+        make_option('--http-timeout',
+            type='float',
+            default=httpclient.TIMEOUT,
+            help='Seconds to wait on a site before retrying'),
+        make_option('--rate-scale',
+            type='float',
+            default=1,
+            help='Multiply every site\'s request rate limit by this '
+                 '(0 for no limits)'),
+        make_option('--circuit-threshold',
+            type='int',
+            default=5,
+            help='Stop fetching from a site after this many failed '
+                 'fetches in a row (0 never to stop)'),
+        make_option('--circuit-cooldown',
+            type='int',
+            default=600,
+            help='Seconds to stop fetching from a failing site for'),
+        make_option('--http-cache',
+            default=HTTP_CACHE_PATH,
+            help='File remembering ETag/Last-Modified headers, so that '
+                 'unchanged articles are not downloaded again '
+                 '("" to disable)'),
+        make_option('--feed-timeout',
+            type='int',
+            default=300,
+            help='Seconds to spend looking for new articles on front pages'),
+        make_option('--maintenance-budget',
+            type='int',
+            default=300,
+            help='Seconds to spend on background git repacking (0 to skip)'),
+        make_option('--diff-cache-size',
+            type='int',
+            default=diffcache.CACHE_SIZE,
+            help='Rendered diffs to keep for the website, dropping the '
+                 'least recently viewed'),
+        make_option('--fetch-budget',
+            type='float',
+            default=0,
+            help='Checks per hour to spend, on the articles that change '
+                 'most (0 for the fixed schedule)'),
+        make_option('--daemon',
+            action='store_true',
+            default=False,
+            help='Keep running, checking each article as it falls due'),
+        make_option('--feed-interval',
+            type='int',
+            default=600,
+            help='With --daemon, seconds between looks for new articles'),
         )
     help = textwrap.dedent('''Scrape websites.
 
@@ -46,6 +147,24 @@ class Command(BaseCommand):
     
     Articles that haven't changed in a while are skipped if we've
     scanned them recently, unless --all is passed.
+
+    With --workers N, up to N articles (and front pages) are
+    downloaded at once (at most --per-domain of them from the same
+    site), and up to --parse-workers of them are parsed at once
+    (in that many processes, with --parse-processes).
+    Waiting on the network is most of the work, so N can be in the
+    hundreds.  Storing to git still happens one article at a time.
+
+    With --fetch-budget N, how often an article is checked depends
+    on how often it has changed, so as to catch the most changes with
+    about N checks an hour.  Articles already scheduled are moved to
+    the new schedule at startup.  Going back to the fixed schedule
+    (without --fetch-budget) only applies to each article from its
+    next check.
+
+    With --daemon, rather than making one pass and exiting, keep
+    checking articles as they fall due and looking for new ones every
+    --feed-interval seconds, until killed.
     '''.strip())
 
     def handle(self, *args, **options):
@@ -53,20 +172,99 @@ class Command(BaseCommand):
         ch.setLevel(logging.DEBUG)
         ch.setFormatter(formatter)
         logger.addHandler(ch)
+        gitmaint.logger.addHandler(ch)
+        diffcache.logger.addHandler(ch)
+        httpclient.logger.addHandler(ch)
 
 
         ch = logging.FileHandler(ERROR_FILE_PATH, mode='a')
         ch.setLevel(logging.WARNING)
         ch.setFormatter(formatter)
         logger.addHandler(ch)
+        gitmaint.logger.addHandler(ch)
+        diffcache.logger.addHandler(ch)
+        httpclient.logger.addHandler(ch)
 
         for repo in all_git_repos():
             cleanup_git_repo(repo)
 
         todays_repo = get_and_make_git_repo()
 
-        update_articles(todays_repo)
-        update_versions(todays_repo, options['all'])
+        if options['html_backend']:
+            if options['html_backend'] not in baseparser.soup_backends:
+                raise CommandError('Unknown or unavailable HTML backend %s '
+                                   '(is its library installed?)'
+                                   % options['html_backend'])
+            baseparser.BaseParser.backend = options['html_backend']
+
+        if options['diff_engine'] not in DIFF_ENGINES:
+            raise CommandError('Unknown diff engine %s'
+                               % options['diff_engine'])
+        global diff_engine
+        diff_engine = options['diff_engine']
+        diffcache.CACHE_SIZE = options['diff_cache_size']
+
+        # Before starting any threads: this may fork parser processes
+        parse_stage = ParseStage(options['parse_workers'],
+                                 options['parse_processes'])
+
+        # Tidy up the repos while we scrape, rather than making the
+        # scrape wait for a gc.  Start now, so that it still gets done
+        # if we're falling behind and get killed.
+        maintenance = None
+        if options['maintenance_budget'] > 0:
+            maintenance = gitmaint.MaintenanceThread(
+                all_git_repos(), options['maintenance_budget'],
+                first=models.GIT_DIR + todays_repo)
+            maintenance.start()
+
+        httpclient.configure(pool_size=options['http_pool_size'],
+                             timeout=options['http_timeout'])
+        if options['rate_scale'] > 0:
+            httpclient.rate_limiter = ratelimit.RateLimiter.for_parsers(
+                parsers.parser_dict, options['rate_scale'])
+        if options['circuit_threshold'] > 0:
+            baseparser.circuit_breaker = retry.CircuitBreaker(
+                options['circuit_threshold'], options['circuit_cooldown'])
+        if options['http_cache']:
+            baseparser.validator_cache = baseparser.ValidatorCache(
+                options['http_cache'])
+
+        if options['fetch_budget'] > 0:
+            set_check_policy(options['fetch_budget'])
+
+        pool = FetchPool(options['workers'], options['per_domain'])
+        try:
+            if options['daemon']:
+                scheduler = Scheduler(pool, options['feed_interval'],
+                                      options['feed_timeout'],
+                                      pipeline=options['git_pipeline'],
+                                      batch_commit=options['batch_commit'],
+                                      maintenance_budget=options['maintenance_budget'],
+                                      maintenance=maintenance,
+                                      fetch_budget=options['fetch_budget'],
+                                      parse_stage=parse_stage)
+                scheduler.run()
+                maintenance = scheduler.maintenance
+            else:
+                update_articles(todays_repo, pool, options['feed_timeout'])
+                update_versions(todays_repo, options['all'], pool=pool,
+                                pipeline=options['git_pipeline'],
+                                batch_commit=options['batch_commit'],
+                                parse_stage=parse_stage)
+                evict_diffs()
+        finally:
+            parse_stage.close()
+            gitstore.close_all()
+            if baseparser.validator_cache is not None:
+                baseparser.validator_cache.close()
+
+        if maintenance is not None:
+            logger.info('Waiting for git maintenance to finish')
+            maintenance.join()
+
+        if baseparser.circuit_breaker is not None:
+            report_circuits(baseparser.circuit_breaker)
 
         logger.info('Done scraping!')
         notify_admins_of_errors()
@@ -94,6 +292,12 @@ def send_email(recipients, subject, body):
     else:
         logger.error('%s does not exist; cannot email errors to admins' % (msmtp_path,))
 
+def report_circuits(circuit_breaker):
+    for domain, times_opened, skipped, still_open in circuit_breaker.summary():
+        logger.warning('Gave up on %s %s times, skipping %s fetches%s',
+                       domain, times_opened, skipped,
+                       ' (still down)' if still_open else '')
+
 # subprocess.check_output appeared in python 2.7.
 # Linerva only has 2.6
 def check_output(*popenargs, **kwargs):
@@ -197,12 +401,37 @@ def run_git_command(command, git_dir, max_timeout=15):
                                       stderr=subprocess.STDOUT)
     return output
 
-def get_all_article_urls():
+def get_all_article_urls(pool=None, timeout=None):
+    """Return the URLs linked from every parser's feeder pages.
+
+    The pages are fetched on pool; pages not done within timeout
+    seconds are given up on.
+    """
+    if pool is None:
+        pool = FetchPool()
+    deadline = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+    pages = [(parser, feeder_url) for parser in parsers.parsers
+             for feeder_url in parser.feeder_pages]
+    logger.info('Looking up %s feeder pages on %s sites' %
+                (len(pages), len(parsers.parsers)))
+
     ans = set()
-    for parser in parsers.parsers:
-        logger.info('Looking up %s' % parser.domains)
-        urls = parser.feed_urls()
+    done = 0
+    for (parser, feeder_url), urls, error in pool.imap(
+            lambda (parser, feeder_url): parser.feed_urls_from(feeder_url),
+            pages, domain=lambda (parser, feeder_url): url_domain(feeder_url),
+            deadline=deadline):
+        done += 1
+        if error is not None:
+            logger.error('Unable to look up %s:\n%s' % (feeder_url, error))
+            continue
+        logger.debug('Got %s urls from %s' % (len(urls), feeder_url))
         ans = ans.union(map(canonicalize_url, urls))
+    if done < len(pages):
+        logger.error('Gave up on %s of %s feeder pages after %s seconds' %
+                     (len(pages) - done, len(pages), timeout))
     return ans
 
 CHARSET_LIST = """EUC-JP GB2312 EUC-KR Big5 SHIFT_JIS windows-1252
@@ -218,41 +447,246 @@ windows-1250
 windows-1251
 windows-1253
 windows-1255""".split()
+# Lead bytes, in utf8, of the characters that canonicalize() or
+# unicode.split() may treat differently from str.split(): whitespace
+# outside ASCII (and \x1c-\x1f), and what parse_double_utf8 repairs.
+# \xe2 is left out, being the lead byte of every curly quote.
+SPECIAL_LEADS = '\x1c\x1d\x1e\x1f\xc2\xc3\xe1\xe3'
+# Those characters themselves
+SPECIAL_BYTES = re.compile(r'[\x1c-\x1f]|\xc2[\x85\xa0]|\xc3[\x82-\xb4]\xc2|'
+                           r'\xe1\x9a\x80|\xe1\xa0\x8e|\xe3\x80\x80|'
+                           r'\xe2(?:\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)')
+SPECIAL_E2 = re.compile(r'\xe2(?:\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)')
+NON_ASCII_BYTE = re.compile(r'[\x80-\xff]')
+# Any character outside ASCII, which all of CHARSET_LIST encode as itself
+NON_ASCII = re.compile(u'[^\x00-\x7f]')
+# How many characters past its ASCII start to look at in a text, to
+# rule out charsets
+CHARSET_PROBE = 16
+
+def extra_canonical(s):
+    """Ignore changes in whitespace or the date line"""
+    # This is fragile: depending on the text looking a particular way!
+    nondate_portion = s.split('\n', 1)[1]
+    return nondate_portion.split()
+
+def is_plain(text):
+    """Whether utf8 text has none of SPECIAL_BYTES"""
+    if len(text.translate(None, SPECIAL_LEADS)) == len(text):
+        return SPECIAL_E2.search(text) is None
+    return SPECIAL_BYTES.search(text) is None
+
+class TextSummary(object):
+    """What is_boring needs to know about a version's text (utf8).
+
+    words are the words after the date line, split as bytes.  Words
+    that are the same as bytes are the same in the canonicalized text,
+    as long as the date line is found in the same place
+    (first_line_ok).  If the text is also plain, words that differ as
+    bytes differ there too.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        stripped = text.lstrip()
+        self.first_line_ok = '!' <= stripped[:1] <= '~'
+        if '\n' in stripped:
+            self.words = stripped.split('\n', 1)[1].split()
+        else:
+            self.words = []
+        self._plain = None
+        self._charset_probe = None
+
+    @property
+    def plain(self):
+        if self._plain is None:
+            self._plain = self.first_line_ok and is_plain(self.text)
+        return self._plain
+
+    def same_words(self, other):
+        """Whether the texts' words are the same, or None if unsure"""
+        if not (self.first_line_ok and other.first_line_ok):
+            return None
+        if self.words == other.words:
+            return True
+        if self.plain and other.plain:
+            return False
+        return None
+
+    def charset_probe(self):
+        """Return the canonicalized text's ASCII start (as bytes), the
+        CHARSET_PROBE characters after it, and whether that is all of
+        the text.
+        """
+        if self._charset_probe is None:
+            text = self.text
+            whole = True
+            if self.plain:
+                # Then canonicalize() only strips lines, so a few whole
+                # lines come out as the start of the whole text.
+                match = NON_ASCII_BYTE.search(text)
+                if match:
+                    end = text.find('\n', match.end() + 4 * CHARSET_PROBE)
+                    if end != -1:
+                        text = text[:end]
+                        whole = False
+            textu = canonicalize(text.decode('utf8'))
+            if not whole:
+                textu = textu.rstrip()
+            match = NON_ASCII.search(textu)
+            ascii_end = match.start() if match else len(textu)
+            self._charset_probe = (textu[:ascii_end].encode('ascii'),
+                                   textu[ascii_end:ascii_end + CHARSET_PROBE],
+                                   whole)
+        return self._charset_probe
+
+    def maybe_encoded_as(self, new):
+        """Whether new might be this text, canonicalized, in one of
+        CHARSET_LIST.
+
+        Every charset there encodes ASCII as itself and anything else
+        as at least one byte, so new has to start with the text's
+        ASCII start and then with the encoding of what comes next.
+        """
+        ascii_start, probe, whole = self.charset_probe()
+        if not new.startswith(ascii_start):
+            return False
+        if not probe:
+            return not whole or len(new) == len(ascii_start)
+        for charset in CHARSET_LIST:
+            try:
+                if new.startswith(probe.encode(charset), len(ascii_start)):
+                    return True
+            except UnicodeEncodeError:
+                pass
+        return False
+
 def is_boring(old, new):
-    oldu = canonicalize(old.decode('utf8'))
-    newu = canonicalize(new.decode('utf8'))
+    return boring_change(TextSummary(old), TextSummary(new))
 
-    def extra_canonical(s):
-        """Ignore changes in whitespace or the date line"""
-        # This is fragile: depending on the text looking a particular way!
-        nondate_portion = s.split('\n', 1)[1]
-        return nondate_portion.split()
+def boring_change(old, new):
+    """Whether new, the TextSummary after old, isn't worth showing.
 
-    if extra_canonical(oldu) == extra_canonical(newu):
+    It isn't if only whitespace or the date line changed, or if new is
+    just old in one of CHARSET_LIST.  Usually that's settled by
+    comparing the words as bytes, without decoding either text.
+    """
+    same = old.same_words(new)
+    if same is None:
+        oldu = canonicalize(old.text.decode('utf8'))
+        newu = canonicalize(new.text.decode('utf8'))
+        same = extra_canonical(oldu) == extra_canonical(newu)
+    if same:
         return True
+    if not old.maybe_encoded_as(new.text):
+        return False
 
     # This seems kind of fragile.  Are we 100% sure that differences between
     # these encodings are unimportant?  Also, how does this relate to non-latin
     # text?
+    oldu = canonicalize(old.text.decode('utf8'))
     for charset in CHARSET_LIST:
         try:
-            if oldu.encode(charset) == new:
+            if oldu.encode(charset) == new.text:
                 logger.debug('Boring!')
                 return True
         except UnicodeEncodeError:
             pass
     return False
 
-def get_diff_info(old, new):
+# How get_diff_info compares versions (--diff-engine): 'lines' diffs
+# the paragraphs first, and only the changed ones character by
+# character; 'chars' diffs the whole text character by character.
+diff_engine = 'lines'
+DIFF_ENGINES = ('lines', 'chars')
+DIFF_TIMEOUT = 3 # seconds; diff_match_patch's default of 1 is too little
+
+def diff_counts(old, new):
+    """Return (chars added, chars removed) in a character diff of old and
+    new, after diff_cleanupSemantic.
+    """
+    if fast_diff_match_patch is not None:
+        diff = fast_diff_match_patch.diff(old, new, timelimit=DIFF_TIMEOUT,
+                                          checklines=True, cleanup='Semantic',
+                                          counts_only=True)
+        return (sum(length for (op, length) in diff if op == '+'),
+                sum(length for (op, length) in diff if op == '-'))
     dmp = diff_match_patch.diff_match_patch()
-    dmp.Diff_Timeout = 3 # seconds; default of 1 is too little
+    dmp.Diff_Timeout = DIFF_TIMEOUT
     diff = dmp.diff_main(old, new)
     dmp.diff_cleanupSemantic(diff)
-    chars_added   = sum(len(text) for (sign, text) in diff if sign == 1)
-    chars_removed = sum(len(text) for (sign, text) in diff if sign == -1)
+    return (sum(len(text) for (sign, text) in diff if sign == 1),
+            sum(len(text) for (sign, text) in diff if sign == -1))
+
+def line_diff_counts(old, new):
+    """Like diff_counts, but diff whole lines (paragraphs) first.
+
+    Only where lines were replaced is there a character diff, of just
+    those lines, so the cost goes with the size of the change rather
+    than of the article.
+    """
+    dmp = diff_match_patch.diff_match_patch()
+    dmp.Diff_Timeout = DIFF_TIMEOUT
+    old_lines, new_lines, line_array = dmp.diff_linesToChars(old, new)
+    diff = dmp.diff_main(old_lines, new_lines, False)
+    # Unlike diff_lineMode, keep even blank lines as matches: they
+    # split the change into one run of lines per edited paragraph.
+    dmp.diff_charsToLines(diff, line_array)
+
+    chars_added = chars_removed = 0
+    deleted = []
+    inserted = []
+    for sign, text in diff + [(dmp.DIFF_EQUAL, '')]:
+        if sign == dmp.DIFF_DELETE:
+            deleted.append(text)
+        elif sign == dmp.DIFF_INSERT:
+            inserted.append(text)
+        else:
+            if deleted and inserted:
+                old_text = ''.join(deleted)
+                new_text = ''.join(inserted)
+                if old_text.count('\n') == new_text.count('\n'):
+                    # Paragraphs edited in place; diff each on its own
+                    pairs = zip(old_text.split('\n'), new_text.split('\n'))
+                else:
+                    pairs = [(old_text, new_text)]
+                added = removed = 0
+                for old_part, new_part in pairs:
+                    counts = diff_counts(old_part, new_part)
+                    added += counts[0]
+                    removed += counts[1]
+            else:
+                added = sum(len(text) for text in inserted)
+                removed = sum(len(text) for text in deleted)
+            chars_added += added
+            chars_removed += removed
+            deleted = []
+            inserted = []
+    return chars_added, chars_removed
+
+def get_diff_info(old, new):
+    if diff_engine == 'lines':
+        chars_added, chars_removed = line_diff_counts(old, new)
+    else:
+        chars_added, chars_removed = diff_counts(old, new)
     return dict(chars_added=chars_added, chars_removed=chars_removed)
 
-def add_to_git_repo(data, filename, article):
+def count_identical_versions(article, blob, get_hash):
+    """Return how many of article's versions have file contents blob.
+
+    This is a database lookup on Version.blob.  Versions stored before
+    that column existed are looked up with get_hash(commit) and
+    remembered, so each is only looked up in git once.
+    """
+    versions = article.versions()
+    for version in versions.filter(blob__isnull=True):
+        models.Version.objects.filter(id=version.id).update(
+            blob=get_hash(version.v))
+    number_equal = versions.filter(blob=blob).count()
+    logger.debug('Got %s previous version files have an identical hash', number_equal)
+    return number_equal
+
+def add_to_git_repo(data, filename, article, batch=None):
     start_time = time.time()
 
     #Don't use full path because it can exceed the maximum filename length
@@ -283,40 +717,31 @@ def add_to_git_repo(data, filename, article):
             return None, None, None
 
         #Now check how many times this same version has appeared before
-        my_hash = run_git_command(['hash-object', filename],
-                                  article.full_git_dir).strip()
-
-        # This is going to look this up separately each time
-        commits = [v.v for v in article.versions()]
-        # Why > 2?  Why not > 1?
-        if len(commits) > 2:
-            logger.debug('Checking for duplicates among %s commits',
-                          len(commits))
-            def get_hash(version):
-                """Return the SHA1 hash of filename in a given version"""
-                output = run_git_command(['ls-tree', '-r', version, filename],
-                                         article.full_git_dir)
-                return output.split()[2]
-            # What's the difference between `hashes` and `commits`?
-            # `hashes` is the file hash, `commits` are the commit hashes
-            hashes = map(get_hash, commits)
-
-            number_equal = sum(1 for h in hashes if h == my_hash)
-
-            logger.debug('Got %s previous version files have an identical hash', number_equal)
-
-            # So if the version has reverted to a previous version, the system might not show it...
-            if number_equal >= 2: #Refuse to list a version more than twice
-
-                # Overwrite the file
-                run_git_command(['checkout', filename], article.full_git_dir)
-                return None, None, None
+        my_hash = gitstore.blob_hash(data)
+
+        def get_hash(version):
+            """Return the SHA1 hash of filename in a given version"""
+            output = run_git_command(['ls-tree', '-r', version, filename],
+                                     article.full_git_dir)
+            return output.split()[2]
+        number_equal = count_identical_versions(article, my_hash, get_hash)
+
+        # So if the version has reverted to a previous version, the system might not show it...
+        if number_equal >= 2: #Refuse to list a version more than twice
+
+            # Overwrite the file
+            run_git_command(['checkout', filename], article.full_git_dir)
+            return None, None, None
 
         if is_boring(previous, data):
             boring = True
         else:
             diff_info = get_diff_info(previous, data)
 
+    if batch is not None:
+        batch.stage(article.full_git_dir, filename, data)
+        return STAGED, boring, diff_info
+
     run_git_command(['add', filename], article.full_git_dir)
     if not already_exists:
         commit_message = 'Adding file %s' % filename
@@ -339,14 +764,134 @@ def add_to_git_repo(data, filename, article):
     return v, boring, diff_info
 
 
-def load_article(url):
+def add_to_git_store(data, filename, article, batch=None):
+    """Like add_to_git_repo, but through a persistent gitstore.GitStore.
+
+    No processes are spawned, and the working tree isn't written.  The
+    returned commit only shows up in the repo at the store's next
+    checkpoint.
+    """
+    start_time = time.time()
+    store = gitstore.get_store(article.full_git_dir)
+
+    boring = False
+    diff_info = None
+
+    previous = store.read(filename)
+    already_exists = previous is not None
+
+    if already_exists:
+        if previous == data:
+            logger.debug('Article matches current version in repo')
+            return None, None, None
+
+        #Now check how many times this same version has appeared before
+        my_hash = gitstore.blob_hash(data)
+        number_equal = count_identical_versions(
+            article, my_hash, lambda version: store.blob(filename, version))
+        if number_equal >= 2: #Refuse to list a version more than twice
+            return None, None, None
+
+        if is_boring(previous, data):
+            boring = True
+        else:
+            diff_info = get_diff_info(previous, data)
+
+    if batch is not None:
+        batch.stage(article.full_git_dir, filename, data)
+        return STAGED, boring, diff_info
+
+    if not already_exists:
+        commit_message = 'Adding file %s' % filename
+    else:
+        commit_message = 'Change to %s' % filename
+    logger.debug('Running git commit... %s', time.time()-start_time)
+    v = store.commit([(filename, data)], commit_message)
+    logger.debug('done %s', time.time()-start_time)
+    return v, boring, diff_info
+
+# Returned by add_to_git_repo in place of a commit ID when the version
+# has been added to a CommitBatch instead of committed.
+STAGED = 'staged'
+
+class CommitBatch(object):
+    """Changed files waiting to go into one commit per repo.
+
+    Rather than committing each changed article as it is found,
+    add_to_git_repo/add_to_git_store stage it here and update_article
+    hands over the new Version rows; commit() then writes a single
+    commit per repo, fills in the rows' commit ID and saves them.
+    """
+
+    def __init__(self, pipeline=False):
+        self.pipeline = pipeline
+        self.files = {}    # git_dir -> [(filename, data)]
+        self.versions = {} # git_dir -> [Version rows]
+
+    def stage(self, git_dir, filename, data):
+        self.files.setdefault(git_dir, []).append((filename, data))
+
+    def add_version(self, git_dir, v_row, save=None):
+        """Fill in v_row.v once committed, then call save()
+
+        save defaults to v_row.save.
+        """
+        self.versions.setdefault(git_dir, []).append((v_row,
+                                                      save or v_row.save))
+
+    def commit(self):
+        files, self.files = self.files, {}
+        versions, self.versions = self.versions, {}
+        for git_dir, staged in files.items():
+            filenames = [filename for filename, data in staged]
+            commit_message = 'Changes to %s files\n\n%s\n' % (
+                len(filenames), '\n'.join(filenames))
+            logger.info('Committing %s files to %s', len(filenames), git_dir)
+            rows = versions.get(git_dir, [])
+            if self.pipeline:
+                store = gitstore.get_store(git_dir)
+                v = store.commit(staged, commit_message)
+            else:
+                for i in range(0, len(filenames), 100):
+                    run_git_command(['add', '--'] + filenames[i:i+100],
+                                    git_dir)
+                run_git_command(['commit', '-m', commit_message], git_dir)
+                v = run_git_command(['rev-list', 'HEAD', '-n1'],
+                                    git_dir).strip()
+            for v_row, save in rows:
+                v_row.v = v
+            if self.pipeline:
+                for v_row, save in rows:
+                    store.after_checkpoint(save)
+            else:
+                for v_row, save in rows:
+                    save()
+
+def load_article(url, conditional=True, known_digest=None, parse_stage=None):
+    """Fetch and parse url.
+
+    Unless conditional is False, the parser doesn't bother parsing a
+    page the server says is unchanged (not_modified), or whose HTML
+    hashes to known_digest (same_html); the parser is returned anyway.
+
+    The parsing is done through parse_stage, a ParseStage, if given.
+    """
     try:
         parser = parsers.get_parser(url)
     except KeyError:
         logger.info('Unable to parse domain, skipping')
         return
     try:
-        parsed_article = parser(url)
+        parsed_article = parser(url, conditional, known_digest, fetch=False)
+        parsed_article.fetch()
+        if parsed_article.needs_parsing():
+            if parse_stage is None:
+                parsed_article.parse()
+            else:
+                parse_stage.parse(parsed_article)
+    except retry.CircuitOpen:
+        logger.debug('Not fetching from a site that is down')
+        return
     except (AttributeError, urllib2.HTTPError, httplib.HTTPException), e:
         if isinstance(e, urllib2.HTTPError) and e.msg == 'Gone':
             return
@@ -354,25 +899,205 @@ def load_article(url):
         logger.error(traceback.format_exc())
         logger.error('Continuing')
         return
+    if parsed_article.not_modified:
+        logger.debug('Not modified since last check')
+        return parsed_article
+    if parsed_article.same_html:
+        logger.debug('HTML unchanged since last check')
+        return parsed_article
     if not parsed_article.real_article:
         return
     return parsed_article
 
+# What a parser worker process sends back
+PARSED_ATTRIBUTES = ('real_article', 'date', 'title', 'byline', 'body')
+
+def parse_in_worker(url, conditional, known_digest, html):
+    """Parse html as the page at url; return {attribute: value}"""
+    parser = parsers.get_parser(url)(url, conditional, known_digest,
+                                     fetch=False)
+    parser.html = html
+    parser.parse()
+    parsed = {}
+    for attr in PARSED_ATTRIBUTES:
+        value = getattr(parser, attr)
+        # Don't send the whole parse tree along with a NavigableString
+        if isinstance(value, basestring):
+            value = unicode(value)
+        parsed[attr] = value
+    return parsed
+
+def ignore_interrupts():
+    # Leave Ctrl-C to the scraper, which will close the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class ParseStage(object):
+    """Parse fetched pages, no more than num_workers at once.
+
+    There are many more fetch threads than cores.  Parsing is
+    CPU-bound, so letting them all parse at once would only keep more
+    parse trees in memory while they wait on each other.
+
+    With processes, the parsing is done in a multiprocessing pool of
+    num_workers processes, so it can use more than one core: the HTML
+    is sent over, and the parsed fields come back.  Create the stage
+    before starting any threads, since the pool forks.
+    """
+
+    def __init__(self, num_workers=1, processes=False):
+        self.slots = threading.Semaphore(max(1, num_workers))
+        self.pool = None
+        if processes:
+            self.pool = multiprocessing.Pool(max(1, num_workers),
+                                             ignore_interrupts)
+
+    def parse(self, parser):
+        if self.pool is None:
+            with self.slots:
+                parser.parse()
+            return
+        parsed = self.pool.apply(parse_in_worker,
+                                 (parser.url, parser.conditional,
+                                  parser.known_digest, parser.html))
+        for attr, value in parsed.items():
+            setattr(parser, attr, value)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+def url_domain(url):
+    return url.split('/')[2]
+
+class FetchPool(object):
+    """Run a function over a list of items on a pool of worker threads.
+
+    Items are handed out in the order given, but no more than
+    per_domain items sharing a domain are in flight at once; an item
+    whose domain is saturated waits while later items from other
+    domains go ahead.  Results are yielded in the calling thread, so
+    anything done with them (git, the database) stays serialized.
+
+    With a single worker, everything runs inline in the calling thread.
+    """
+
+    def __init__(self, num_workers=1, per_domain=2):
+        self.num_workers = max(1, num_workers)
+        self.per_domain = max(1, per_domain)
+
+    def imap(self, func, items, domain=url_domain, key=lambda x: x,
+             deadline=None):
+        """Yield (item, result, error) for each item, in completion order.
+
+        func is called with key(item); error is a formatted traceback
+        if func raised, and None otherwise.  If deadline (a time.time()
+        value) passes, stop early: items not yet finished are dropped.
+        """
+        if self.num_workers == 1:
+            for item in items:
+                if deadline is not None and time.time() >= deadline:
+                    return
+                try:
+                    yield item, func(key(item)), None
+                except Exception:
+                    yield item, None, traceback.format_exc()
+            return
+
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+
+        def work():
+            while True:
+                item = tasks.get()
+                if item is None:
+                    return
+                try:
+                    results.put((item, func(key(item)), None))
+                except Exception:
+                    results.put((item, None, traceback.format_exc()))
+
+        threads = [threading.Thread(target=work)
+                   for i in range(self.num_workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        # domain -> list of (position, item) still to be handed out,
+        # reversed so that the next one is at the end
+        waiting = {}
+        for i, item in enumerate(items):
+            waiting.setdefault(domain(key(item)), []).append((i, item))
+        for lst in waiting.values():
+            lst.reverse()
+        in_flight = dict.fromkeys(waiting, 0)
+        outstanding = 0
+        try:
+            while waiting or outstanding:
+                while outstanding < self.num_workers:
+                    ready = [d for d in waiting
+                             if in_flight[d] < self.per_domain]
+                    if not ready:
+                        break
+                    d = min(ready, key=lambda d: waiting[d][-1][0])
+                    tasks.put(waiting[d].pop()[1])
+                    if not waiting[d]:
+                        del waiting[d]
+                    in_flight[d] += 1
+                    outstanding += 1
+
+                if deadline is None:
+                    item, result, error = results.get()
+                else:
+                    try:
+                        item, result, error = results.get(
+                            timeout=max(0, deadline - time.time()))
+                    except Queue.Empty:
+                        return
+                in_flight[domain(key(item))] -= 1
+                outstanding -= 1
+                yield item, result, error
+        finally:
+            for t in threads:
+                tasks.put(None)
+
+def remember_stored(article, parsed_article):
+    """Record that parsed_article's page is stored, so it needn't be again"""
+    parsed_article.remember_validators()
+    if parsed_article.html_digest != article.html_digest:
+        article.html_digest = parsed_article.html_digest
+        # The version may be saved after the article, so update directly
+        models.Article.objects.filter(id=article.id).update(
+            html_digest=article.html_digest)
+
 #Update url in git
 #Return whether it changed
-def update_article(article):
-    parsed_article = load_article(article.url)
+def update_article(article, parsed_article=None, pipeline=False, batch=None):
+    if parsed_article is None:
+        parsed_article = load_article(article.url,
+                                      known_digest=article.html_digest)
     if parsed_article is None:
         return
+    if parsed_article.not_modified:
+        return
+    if parsed_article.same_html:
+        # What's stored is this page already, but its ETag or
+        # Last-Modified may be new
+        remember_stored(article, parsed_article)
+        return
     to_store = unicode(parsed_article).encode('utf8')
     t = datetime.now()
     logger.debug('Article parsed; trying to store')
-    v, boring, diff_info = add_to_git_repo(to_store,
-                                           article.filename(),
-                                           article)
+    if pipeline:
+        add = add_to_git_store
+    else:
+        add = add_to_git_repo
+    v, boring, diff_info = add(to_store, article.filename(), article, batch)
     if v:
         logger.info('Modifying! new blob: %s', v)
         v_row = models.Version(v=v,
+                               blob=gitstore.blob_hash(to_store),
                                boring=boring,
                                title=parsed_article.title,
                                byline=parsed_article.byline,
@@ -380,95 +1105,365 @@ def update_article(article):
                                article=article,
                                )
         v_row.diff_info = diff_info
-        v_row.save()
+        def save():
+            v_row.save()
+            remember_stored(article, parsed_article)
+            if diff_info is not None:
+                cache_diff(v_row, to_store)
+        if v is STAGED:
+            batch.add_version(article.full_git_dir, v_row, save)
+        elif pipeline:
+            # Don't point the website at the commit until it exists
+            gitstore.get_store(article.full_git_dir).after_checkpoint(save)
+        else:
+            save()
         if not boring:
+            article.change_score = recheck.add_change(
+                article.change_score, article.last_update, t)
             article.last_update = t
             article.save()
+    else:
+        remember_stored(article, parsed_article)
+
+def cache_diff(v_row, text):
+    """Store the diff diffview shows for a new version, with text"""
+    try:
+        diffcache.store_adjacent(v_row, text)
+    except Exception:
+        logger.error('Unable to store the diff to version %s', v_row.id)
+        logger.error(traceback.format_exc())
+
+def evict_diffs():
+    try:
+        diffcache.evict()
+    except Exception:
+        logger.error('Unable to drop old diffs')
+        logger.error(traceback.format_exc())
+
+# Rows to look up or insert per query.  SQLite allows at most 999
+# parameters in a query.
+DB_CHUNK_SIZE = 500
 
-def update_articles(todays_git_dir):
+def update_articles(todays_git_dir, pool=None, feed_timeout=None):
     logger.info('Starting scraper; looking for new URLs')
-    all_urls = get_all_article_urls()
+    all_urls = get_all_article_urls(pool, feed_timeout)
     logger.info('Got all %s urls; storing to database' % len(all_urls))
-    for i, url in enumerate(all_urls):
-        logger.debug('Woo: %d/%d is %s' % (i+1, len(all_urls), url))
-        # Looks like it skips URLs longer than 255?
-        if len(url) > 255:  #Icky hack, but otherwise they're truncated in DB.
-            continue
-        # Is there an index on this column?
-        if not models.Article.objects.filter(url=url).count():
-            logger.debug('Adding Article {0}'.format(url))
-            models.Article(url=url, git_dir=todays_git_dir).save()
+    # Skip URLs longer than 255; they'd be truncated in the DB.
+    all_urls = [url for url in all_urls if len(url) <= 255]
+    new_urls = set(all_urls)
+    for i in range(0, len(all_urls), DB_CHUNK_SIZE):
+        chunk = all_urls[i:i+DB_CHUNK_SIZE]
+        new_urls.difference_update(models.Article.objects.filter(
+                url__in=chunk).values_list('url', flat=True))
+    for url in new_urls:
+        logger.debug('Adding Article {0}'.format(url))
+    # bulk_create doesn't call Article.save(); new articles are due now.
+    now = datetime.now()
+    models.Article.objects.bulk_create(
+        [models.Article(url=url, git_dir=todays_git_dir, next_check_at=now)
+         for url in new_urls],
+        batch_size=DB_CHUNK_SIZE)
+    logger.info('Added %s new articles' % len(new_urls))
     logger.info('Done storing to database')
 
-def get_update_delay(minutes_since_update):
-    days_since_update = minutes_since_update // (24 * 60)
-    if minutes_since_update < 60*3:
-        return 15
-    elif days_since_update < 1:
-        return 60
-    elif days_since_update < 7:
-        return 180
-    elif days_since_update < 30:
-        return 60*24*3
-    elif days_since_update < 360:
-        return 60*24*30
+def set_check_policy(fetch_budget):
+    """Schedule checks to spend about fetch_budget checks an hour.
+
+    Each article's change rate is worked out from its history, and
+    models.check_policy becomes a recheck.AdaptivePolicy that checks
+    the articles that change most the most often.  The articles'
+    stored next_check_at are then worked out again with it.
+    """
+    now = datetime.now()
+    threshold = now - recheck.MAX_AGE
+    articles = models.Article.objects.exclude(git_dir='old').filter(
+        Q(last_update__gt=threshold) | Q(initial_date__gt=threshold))
+    rows = articles.values_list('change_score', 'last_update', 'initial_date')
+    total_rate = 0.
+    for change_score, last_update, initial_date in rows.iterator():
+        total_rate += recheck.change_rate(change_score,
+                                          max(last_update, initial_date),
+                                          initial_date, now)
+    factor = recheck.budget_factor(total_rate, fetch_budget)
+    logger.info('Expecting %.1f changes an hour; checking %s articles an '
+                'hour, %.3f changes per check', total_rate, fetch_budget,
+                factor)
+    models.check_policy = recheck.AdaptivePolicy(factor)
+    reschedule(articles)
+
+# reschedule() leaves an article's next_check_at alone if it would move
+# by less than this, to save writes when the policy changes a little
+RESCHEDULE_SLACK = timedelta(minutes=5)
+
+def reschedule(articles):
+    """Update next_check_at of articles, a queryset, to the current policy.
+
+    Article.save() does this for the article it saves; this is for
+    when models.check_policy changes.
+    """
+    rows = articles.values_list('id', 'last_check', 'last_update',
+                                'initial_date', 'change_score',
+                                'next_check_at')
+    moved = 0
+    for (article_id, last_check, last_update, initial_date, change_score,
+         next_check_at) in rows.iterator():
+        due = models.scheduled_check(last_check, last_update, initial_date,
+                                     change_score)
+        if due is None or next_check_at is None:
+            if due is next_check_at:
+                continue
+        elif abs(due - next_check_at) < RESCHEDULE_SLACK:
+            continue
+        models.Article.objects.filter(id=article_id).update(next_check_at=due)
+        moved += 1
+    logger.info('Rescheduled %s articles for the new check policy', moved)
+
+def articles_to_check(do_all=False, chunk_size=DB_CHUNK_SIZE):
+    """Yield lists of up to chunk_size articles that are due for a check.
+
+    Articles come most overdue first, by Article.next_check_at.  With
+    do_all, every article from the last year comes, in id order.  Only
+    one chunk is held in memory at a time.
+    """
+    articles = models.Article.objects.exclude(git_dir='old')
+    if do_all:
+        threshold = datetime.now() - timedelta(days=366)
+        articles = articles.filter(Q(last_update__gt=threshold) |
+                                   Q(initial_date__gt=threshold))
+        order = ('id',)
     else:
-        return 60*24*365*1e5  #ignore old articles
+        articles = articles.filter(next_check_at__lte=datetime.now())
+        order = ('next_check_at', 'id')
+    articles = articles.order_by(*order)
+    chunk = list(articles[:chunk_size])
+    while chunk:
+        # Checking an article changes its next_check_at, so carry on
+        # from where this chunk ended as it was read.
+        last = chunk[-1]
+        yield chunk
+        if do_all:
+            rest = Q(id__gt=last.id)
+        else:
+            rest = (Q(next_check_at__gt=last.next_check_at) |
+                    Q(next_check_at=last.next_check_at, id__gt=last.id))
+        chunk = list(articles.filter(rest)[:chunk_size])
+
+def check_article(article, parsed_article, error, pipeline=False,
+                  batch=None):
+    """Store what loading article gave, and record that it was checked.
+
+    parsed_article and error are as yielded by FetchPool.imap.
+    """
+    logger.info('Considering %s', article.url)
+
+    article.last_check = datetime.now()
+    try:
+        if error is not None:
+            logger.error('Unknown exception when loading %s', article.url)
+            logger.error(error)
+        elif parsed_article is not None:
+            update_article(article, parsed_article, pipeline, batch)
+    except Exception, e:
+        if isinstance(e, subprocess.CalledProcessError):
+            logger.error('CalledProcessError when updating %s', article.url)
+            logger.error(repr(e.output))
+        else:
+            logger.error('Unknown exception when updating %s', article.url)
+
+        logger.error(traceback.format_exc())
+    article.save()
 
-def update_versions(todays_repo, do_all=False):
+def update_versions(todays_repo, do_all=False, pool=None, pipeline=False,
+                    batch_commit=False, parse_stage=None):
     logger.info('Looking for articles to check')
-    # For memory issues, restrict to the last year of articles
-    threshold = datetime.now() - timedelta(days=366)
-    article_query = models.Article.objects.exclude(git_dir='old').filter(Q(last_update__gt=threshold) | 
-                                                                         Q(initial_date__gt=threshold))
-    articles = list(article_query)
-    total_articles = len(articles)
-
-    update_priority = lambda x: x.minutes_since_check() * 1. / get_update_delay(x.minutes_since_update())
-    articles = sorted([a for a in articles if update_priority(a) > 1 or do_all],
-                      key=update_priority, reverse=True)
-
-    logger.info('Checking %s of %s articles', len(articles), total_articles)
-
-    # Do git gc at the beginning, so if we're falling behind and killed
-    # it still happens and I don't run out of quota. =)
-    logger.info('Starting with gc:')
+    if pool is None:
+        pool = FetchPool()
+    if batch_commit:
+        batch = CommitBatch(pipeline)
+    else:
+        batch = None
+    # With --all, fetch and parse everything in full
+    def load(article):
+        return load_article(article.url, not do_all, article.html_digest,
+                            parse_stage)
+    def results():
+        for chunk in articles_to_check(do_all):
+            logger.info('Checking %s more articles', len(chunk))
+            for result in pool.imap(load, chunk,
+                                    domain=lambda a: url_domain(a.url)):
+                yield result
+    checked = not_modified = same_html = 0
     try:
-        run_git_command(['gc'], models.GIT_DIR + todays_repo)
-    except subprocess.CalledProcessError as e:
-        print >> sys.stderr, 'Error on initial gc!'
-        print >> sys.stderr, 'Output was """'
-        print >> sys.stderr, e.output
-        print >> sys.stderr, '"""'
-        raise
+        for article, parsed_article, error in results():
+            checked += 1
+            if parsed_article is not None:
+                if parsed_article.not_modified:
+                    not_modified += 1
+                elif parsed_article.same_html:
+                    same_html += 1
+            check_article(article, parsed_article, error, pipeline, batch)
+    finally:
+        if batch is not None:
+            batch.commit()
+    logger.info('Skipped parsing %s of %s articles: %s not modified '
+                '(HTTP 304), %s with unchanged HTML',
+                not_modified + same_html, checked,
+                not_modified, same_html)
+    #logger.info('Ending with gc:')
+    #run_git_command(['gc'])
 
-    logger.info('Done with gc!')
+# How far ahead Scheduler looks in the database for articles coming due
+SCHEDULER_HORIZON = timedelta(hours=1)
+# How often Scheduler starts another round of git maintenance
+MAINTENANCE_INTERVAL = 24 * 60 * 60
 
-    for i, article in enumerate(articles):
-        logger.debug('Woo: %s %s %s (%s/%s)',
-                     article.minutes_since_update(),
-                     article.minutes_since_check(),
-                     update_priority(article), i+1, len(articles))
-        delay = get_update_delay(article.minutes_since_update())
-        # isn't this inherent in update_priority being > 1 above?
-        if article.minutes_since_check() < delay and not do_all:
-            continue
-        logger.info('Considering %s', article.url)
+class Scheduler(object):
+    """Check articles as they fall due, for as long as we're running.
 
-        article.last_check = datetime.now()
-        try:
-            update_article(article)
-        except Exception, e:
-            if isinstance(e, subprocess.CalledProcessError):
-                logger.error('CalledProcessError when updating %s', article.url)
-                logger.error(repr(e.output))
-            else:
-                logger.error('Unknown exception when updating %s', article.url)
+    Articles due within SCHEDULER_HORIZON are kept in a heap of
+    (next_check_at, article id), refilled from the database as the
+    horizon passes.  Due articles are handed to the FetchPool a round
+    at a time, and each one checked goes back on the heap if it is due
+    again soon.  Every feed_interval seconds, the front pages are
+    scanned for new articles.
+
+    All the state worth keeping is Article.next_check_at, which is
+    saved as each article is checked, so a restarted Scheduler carries
+    on where the last one stopped.
 
+    With a fetch_budget, the check policy is worked out again each time
+    the horizon passes.
+    """
+
+    def __init__(self, pool, feed_interval, feed_timeout=None,
+                 pipeline=False, batch_commit=False, maintenance_budget=0,
+                 maintenance=None, fetch_budget=0, parse_stage=None):
+        self.pool = pool
+        self.feed_interval = feed_interval
+        self.feed_timeout = feed_timeout
+        self.pipeline = pipeline
+        self.batch_commit = batch_commit
+        self.maintenance_budget = maintenance_budget
+        self.maintenance = maintenance
+        self.maintenance_started = time.time()
+        self.fetch_budget = fetch_budget
+        self.parse_stage = parse_stage
+        self.heap = []
+        self.queued = set()      # ids of the articles in heap
+        self.horizon_end = None  # heap has every article due before this
+        self.stopping = False
+
+    def stop(self, signum=None, frame=None):
+        logger.info('Stopping once the current round is done')
+        self.stopping = True
+
+    def schedule(self, article_id, due):
+        if (due is not None and due < self.horizon_end and
+            article_id not in self.queued):
+            heapq.heappush(self.heap, (due, article_id))
+            self.queued.add(article_id)
+
+    def refill(self):
+        """Put every article due before the new horizon on the heap"""
+        self.horizon_end = datetime.now() + SCHEDULER_HORIZON
+        rows = models.Article.objects.exclude(git_dir='old').filter(
+            next_check_at__lt=self.horizon_end).values_list('id',
+                                                            'next_check_at')
+        for article_id, due in rows.iterator():
+            self.schedule(article_id, due)
+        logger.info('%s articles due in the next %s', len(self.heap),
+                    SCHEDULER_HORIZON)
+
+    def due_articles(self):
+        """Take up to DB_CHUNK_SIZE articles due now off the heap"""
+        now = datetime.now()
+        ids = []
+        while (self.heap and self.heap[0][0] <= now and
+               len(ids) < DB_CHUNK_SIZE):
+            due, article_id = heapq.heappop(self.heap)
+            self.queued.discard(article_id)
+            ids.append(article_id)
+        # Anything checked since it was put on the heap is no longer due
+        articles = [a for a in models.Article.objects.in_bulk(ids).values()
+                    if a.next_check_at is not None and a.next_check_at <= now]
+        articles.sort(key=lambda a: (a.next_check_at, a.id))
+        return articles
+
+    def check(self, articles):
+        logger.info('Checking %s articles; %s more due within %s',
+                    len(articles), len(self.heap), SCHEDULER_HORIZON)
+        if self.batch_commit:
+            batch = CommitBatch(self.pipeline)
+        else:
+            batch = None
+        def load(article):
+            return load_article(article.url, True, article.html_digest,
+                                self.parse_stage)
+        try:
+            for article, parsed_article, error in self.pool.imap(
+                    load, articles, domain=lambda a: url_domain(a.url)):
+                check_article(article, parsed_article, error, self.pipeline,
+                              batch)
+                self.schedule(article.id, article.next_check_at)
+        finally:
+            if batch is not None:
+                batch.commit()
+            if self.pipeline:
+                # Don't leave new versions waiting for the next round
+                try:
+                    gitstore.checkpoint_all()
+                except gitstore.GitError:
+                    # Those versions are dropped, and get stored again
+                    # when their articles are next checked
+                    logger.error(traceback.format_exc())
+
+    def refresh_feeds(self):
+        try:
+            todays_repo = get_and_make_git_repo()
+            update_articles(todays_repo, self.pool, self.feed_timeout)
+        except Exception:
+            logger.error('Unknown exception when looking for new articles')
             logger.error(traceback.format_exc())
-        article.save()
-    #logger.info('Ending with gc:')
-    #run_git_command(['gc'])
+            return
+        # Make sure the new articles get on the heap
+        self.refill()
+        evict_diffs()
+        if (self.maintenance_budget > 0 and
+            time.time() >= self.maintenance_started + MAINTENANCE_INTERVAL and
+            (self.maintenance is None or not self.maintenance.is_alive())):
+            self.maintenance = gitmaint.MaintenanceThread(
+                all_git_repos(), self.maintenance_budget,
+                first=models.GIT_DIR + todays_repo)
+            self.maintenance.start()
+            self.maintenance_started = time.time()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.refill()
+        next_feeds = time.time()
+        while not self.stopping:
+            if time.time() >= next_feeds:
+                self.refresh_feeds()
+                next_feeds = time.time() + self.feed_interval
+            if datetime.now() >= self.horizon_end:
+                if self.fetch_budget > 0:
+                    set_check_policy(self.fetch_budget)
+                    # Articles may now be due sooner than they're queued
+                    self.heap = []
+                    self.queued = set()
+                self.refill()
+            articles = self.due_articles()
+            if articles:
+                self.check(articles)
+                continue
+            wake = min(next_feeds - time.time(),
+                       (self.horizon_end - datetime.now()).total_seconds())
+            if self.heap:
+                wake = min(wake,
+                           (self.heap[0][0] - datetime.now()).total_seconds())
+            # Wake up now and then to notice being stopped
+            time.sleep(min(max(wake, 0), 60))
 
 #Remove index.lock if 5 minutes old
 def cleanup_git_repo(git_dir):
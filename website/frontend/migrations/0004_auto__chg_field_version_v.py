@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Removing unique constraint on 'Version', fields ['v']
+        db.delete_unique('version', ['v'])
+
+        # Adding index on 'Version', fields ['v']
+        db.create_index('version', ['v'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'Version', fields ['v']
+        db.delete_index('version', ['v'])
+
+        # Adding unique constraint on 'Version', fields ['v']
+        db.create_unique('version', ['v'])
+
+
+    models = {
+        'frontend.article': {
+            'Meta': {'object_name': 'Article', 'db_table': "'Articles'"},
+            'git_dir': ('django.db.models.fields.CharField', [], {'default': "'old'", 'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'initial_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'last_check': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'last_update': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'url': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'})
+        },
+        'frontend.upvote': {
+            'Meta': {'object_name': 'Upvote', 'db_table': "'upvotes'"},
+            'article_id': ('django.db.models.fields.IntegerField', [], {}),
+            'creation_time': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_v1': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'diff_v2': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'upvoter_ip': ('django.db.models.fields.CharField', [], {'max_length': '255'})
+        },
+        'frontend.version': {
+            'Meta': {'object_name': 'Version', 'db_table': "'version'"},
+            'article': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['frontend.Article']"}),
+            'blob': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True', 'db_index': 'True'}),
+            'boring': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'byline': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_json': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'v': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['frontend']
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+from django.db.models import Q
+
+
+# The check schedule as of this migration, copied from models so that
+# later changes to scheduling don't change what the migration does
+UPDATE_DELAYS = [(datetime.timedelta(hours=3), datetime.timedelta(minutes=15)),
+                 (datetime.timedelta(days=1), datetime.timedelta(hours=1)),
+                 (datetime.timedelta(days=7), datetime.timedelta(hours=3)),
+                 (datetime.timedelta(days=30), datetime.timedelta(days=3)),
+                 (datetime.timedelta(days=360), datetime.timedelta(days=30)),
+                 ]
+
+def next_check_time(last_check, last_update):
+    since = datetime.timedelta(0)
+    for until, delay in UPDATE_DELAYS:
+        due = max(last_check + delay, last_update + since)
+        if due < last_update + until:
+            return due
+        since = until
+    return None
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'Article.next_check_at'
+        db.add_column('Articles', 'next_check_at',
+                      self.gf('django.db.models.fields.DateTimeField')(null=True, db_index=True),
+                      keep_default=False)
+
+        if not db.dry_run:
+            # Work out when each article is due.  Ones unchanged for
+            # too long are left NULL and never checked.
+            threshold = datetime.datetime.now() - datetime.timedelta(days=366)
+            rows = orm['frontend.Article'].objects.exclude(git_dir='old').filter(
+                Q(last_update__gt=threshold) | Q(initial_date__gt=threshold)
+                ).values_list('id', 'last_check', 'last_update', 'initial_date')
+            for id, last_check, last_update, initial_date in rows.iterator():
+                orm['frontend.Article'].objects.filter(id=id).update(
+                    next_check_at=next_check_time(
+                        last_check, max(last_update, initial_date)))
+
+
+    def backwards(self, orm):
+        # Deleting field 'Article.next_check_at'
+        db.delete_column('Articles', 'next_check_at')
+
+
+    models = {
+        'frontend.article': {
+            'Meta': {'object_name': 'Article', 'db_table': "'Articles'"},
+            'git_dir': ('django.db.models.fields.CharField', [], {'default': "'old'", 'max_length': '255'}),
+            'html_digest': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'initial_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'last_check': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'last_update': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'next_check_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'db_index': 'True'}),
+            'url': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'})
+        },
+        'frontend.upvote': {
+            'Meta': {'object_name': 'Upvote', 'db_table': "'upvotes'"},
+            'article_id': ('django.db.models.fields.IntegerField', [], {}),
+            'creation_time': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_v1': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'diff_v2': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'upvoter_ip': ('django.db.models.fields.CharField', [], {'max_length': '255'})
+        },
+        'frontend.version': {
+            'Meta': {'object_name': 'Version', 'db_table': "'version'"},
+            'article': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['frontend.Article']"}),
+            'blob': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True', 'db_index': 'True'}),
+            'boring': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'byline': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_json': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'v': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['frontend']
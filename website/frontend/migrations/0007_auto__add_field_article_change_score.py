@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import datetime
+import math
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+# recheck.DECAY and recheck.add_change as of this migration, copied so
+# that later tuning doesn't change what the migration does
+DECAY = datetime.timedelta(days=1)
+
+def hours(delta):
+    return max(delta.total_seconds(), 0) / 3600.
+
+def add_change(change_score, last_change, when):
+    if not change_score:
+        return 1.
+    return change_score * math.exp(-hours(when - last_change) /
+                                   hours(DECAY)) + 1
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'Article.change_score'
+        db.add_column('Articles', 'change_score',
+                      self.gf('django.db.models.fields.FloatField')(default=0),
+                      keep_default=False)
+
+        if not db.dry_run:
+            # Older changes have decayed to nothing
+            threshold = datetime.datetime.now() - 30 * DECAY
+            versions = orm['frontend.Version'].objects.filter(
+                boring=False, date__gt=threshold).order_by('article', 'date')
+            scores = {}
+            for article_id, date in versions.values_list('article', 'date'):
+                score, last_change = scores.get(article_id, (0, date))
+                scores[article_id] = (
+                    add_change(score, last_change, date), date)
+            for article_id, (score, last_change) in scores.items():
+                orm['frontend.Article'].objects.filter(id=article_id).update(
+                    change_score=score)
+
+
+    def backwards(self, orm):
+        # Deleting field 'Article.change_score'
+        db.delete_column('Articles', 'change_score')
+
+
+    models = {
+        'frontend.article': {
+            'Meta': {'object_name': 'Article', 'db_table': "'Articles'"},
+            'git_dir': ('django.db.models.fields.CharField', [], {'default': "'old'", 'max_length': '255'}),
+            'html_digest': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'change_score': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'initial_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'last_check': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'last_update': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'next_check_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'db_index': 'True'}),
+            'url': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'})
+        },
+        'frontend.upvote': {
+            'Meta': {'object_name': 'Upvote', 'db_table': "'upvotes'"},
+            'article_id': ('django.db.models.fields.IntegerField', [], {}),
+            'creation_time': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_v1': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'diff_v2': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'upvoter_ip': ('django.db.models.fields.CharField', [], {'max_length': '255'})
+        },
+        'frontend.version': {
+            'Meta': {'object_name': 'Version', 'db_table': "'version'"},
+            'article': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['frontend.Article']"}),
+            'blob': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True', 'db_index': 'True'}),
+            'boring': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'byline': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_json': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'v': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['frontend']
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'DiffCache'
+        db.create_table('diffcache', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('v1', self.gf('django.db.models.fields.related.ForeignKey')(related_name='+', to=orm['frontend.Version'])),
+            ('v2', self.gf('django.db.models.fields.related.ForeignKey')(related_name='+', to=orm['frontend.Version'])),
+            ('delta', self.gf('django.db.models.fields.TextField')()),
+            ('html', self.gf('django.db.models.fields.TextField')()),
+            ('last_used', self.gf('django.db.models.fields.DateTimeField')(db_index=True)),
+        ))
+        db.send_create_signal('frontend', ['DiffCache'])
+
+        # Adding unique constraint on 'DiffCache', fields ['v1', 'v2']
+        db.create_unique('diffcache', ['v1_id', 'v2_id'])
+
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'DiffCache', fields ['v1', 'v2']
+        db.delete_unique('diffcache', ['v1_id', 'v2_id'])
+
+        # Deleting model 'DiffCache'
+        db.delete_table('diffcache')
+
+
+    models = {
+        'frontend.article': {
+            'Meta': {'object_name': 'Article', 'db_table': "'Articles'"},
+            'git_dir': ('django.db.models.fields.CharField', [], {'default': "'old'", 'max_length': '255'}),
+            'html_digest': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'change_score': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'initial_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'last_check': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'last_update': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime(1901, 1, 1, 0, 0)'}),
+            'next_check_at': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'db_index': 'True'}),
+            'url': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'})
+        },
+        'frontend.diffcache': {
+            'Meta': {'unique_together': "(('v1', 'v2'),)", 'object_name': 'DiffCache', 'db_table': "'diffcache'"},
+            'delta': ('django.db.models.fields.TextField', [], {}),
+            'html': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_used': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'v1': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'+'", 'to': "orm['frontend.Version']"}),
+            'v2': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'+'", 'to': "orm['frontend.Version']"})
+        },
+        'frontend.upvote': {
+            'Meta': {'object_name': 'Upvote', 'db_table': "'upvotes'"},
+            'article_id': ('django.db.models.fields.IntegerField', [], {}),
+            'creation_time': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_v1': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'diff_v2': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'upvoter_ip': ('django.db.models.fields.CharField', [], {'max_length': '255'})
+        },
+        'frontend.version': {
+            'Meta': {'object_name': 'Version', 'db_table': "'version'"},
+            'article': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['frontend.Article']"}),
+            'blob': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True', 'db_index': 'True'}),
+            'boring': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'byline': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {}),
+            'diff_json': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'v': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['frontend']
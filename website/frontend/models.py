@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 import json
 from django.db import models, IntegrityError
 
+import gitstore
+
 THIS_DIR = os.path.dirname(os.path.realpath(__file__))
 ROOT_DIR = os.path.dirname(os.path.dirname(THIS_DIR))
 GIT_DIR = ROOT_DIR+'/articles/'
@@ -26,6 +28,43 @@ PublicationDict = {'www.nytimes.com': 'NYT',
 
 ancient = datetime(1901, 1, 1)
 
+# How long to wait between checks of an article, by how long it's been
+# since the article last changed: (changed less than this long ago,
+# wait this long).  Articles unchanged for longer are not checked.
+UPDATE_DELAYS = [(timedelta(hours=3), timedelta(minutes=15)),
+                 (timedelta(days=1), timedelta(hours=1)),
+                 (timedelta(days=7), timedelta(hours=3)),
+                 (timedelta(days=30), timedelta(days=3)),
+                 (timedelta(days=360), timedelta(days=30)),
+                 ]
+
+def next_check_time(last_check, last_update):
+    """Return when an article is next due for a check, or None for never.
+
+    That's the first time when the time since last_check reaches the
+    UPDATE_DELAYS entry for the time since last_update.
+    """
+    since = timedelta(0)
+    for until, delay in UPDATE_DELAYS:
+        due = max(last_check + delay, last_update + since)
+        if due < last_update + until:
+            return due
+        since = until
+    return None
+
+# If set, a recheck.AdaptivePolicy used in place of next_check_time().
+# Article.save() applies it; when changing it, call scraper's
+# reschedule() for the articles already saved under the old one.
+check_policy = None
+
+def scheduled_check(last_check, last_update, first_seen, change_score):
+    """Return an article's next_check_at under check_policy"""
+    last_update = max(last_update, first_seen)
+    if check_policy is None:
+        return next_check_time(last_check, last_update)
+    return check_policy.next_check_time(last_check, last_update, first_seen,
+                                        change_score)
+
 # Create your models here.
 class Article(models.Model):
     class Meta:
@@ -37,6 +76,18 @@ class Article(models.Model):
     last_update = models.DateTimeField(default=ancient)
     last_check = models.DateTimeField(default=ancient)
     git_dir = models.CharField(max_length=255, blank=False, default='old')
+    # baseparser.html_digest of the page when it was last stored
+    html_digest = models.CharField(max_length=40, null=True)
+    # scheduled_check() as of the last save; NULL if never due
+    next_check_at = models.DateTimeField(null=True, db_index=True)
+    # recheck.add_change() over the changes up to last_update
+    change_score = models.FloatField(default=0)
+
+    def save(self, *args, **kwargs):
+        self.next_check_at = scheduled_check(
+            self.last_check, self.last_update,
+            self.initial_date or datetime.now(), self.change_score)
+        super(Article, self).save(*args, **kwargs)
 
     @property
     def full_git_dir(self):
@@ -78,20 +129,28 @@ class Version(models.Model):
         get_latest_by = 'date'
 
     article = models.ForeignKey('Article', null=False)
-    v = models.CharField(max_length=255, blank=False, unique=True)
+    # Commit holding this version.  Not unique: with batched commits,
+    # one commit holds a version of each article changed in a pass.
+    v = models.CharField(max_length=255, blank=False, db_index=True)
     title = models.CharField(max_length=255, blank=False)
     byline = models.CharField(max_length=255,blank=False)
     date = models.DateTimeField(blank=False)
     boring = models.BooleanField(blank=False, default=False)
     diff_json = models.CharField(max_length=255, null=True)
+    # SHA1 of the article's file in commit v, for finding repeats
+    blob = models.CharField(max_length=40, null=True, db_index=True)
 
     def text(self):
-        try:
-            return subprocess.check_output([GIT_PROGRAM, 'show',
-                                            self.v+':'+self.article.filename()],
-                                           cwd=self.article.full_git_dir)
-        except subprocess.CalledProcessError as e:
-            return None
+        """Return the version's text as stored (UTF-8), or None"""
+        git_dir = self.article.full_git_dir
+        text = None
+        if self.blob:
+            # Identical versions share an entry in the cache
+            text = gitstore.blob_cache.read(git_dir, self.blob)
+        if text is None:
+            text = gitstore.blob_cache.read(
+                git_dir, self.v+':'+self.article.filename())
+        return text
 
     def get_diff_info(self):
         if self.diff_json is None:
@@ -105,6 +164,20 @@ class Version(models.Model):
     diff_info = property(get_diff_info, set_diff_info)
 
 
+class DiffCache(models.Model):
+    """A rendered diff between two versions; see diffcache.py"""
+    class Meta:
+        db_table = 'diffcache'
+        unique_together = (('v1', 'v2'),)
+
+    v1 = models.ForeignKey('Version', related_name='+')
+    v2 = models.ForeignKey('Version', related_name='+')
+    # diff_match_patch.diff_toDelta() of the diff
+    delta = models.TextField()
+    html = models.TextField()
+    last_used = models.DateTimeField(db_index=True)
+
+
 class Upvote(models.Model):
     class Meta:
         db_table = 'upvotes'
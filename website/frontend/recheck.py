@@ -0,0 +1,124 @@
+"""Recheck intervals learned from each article's own changes.
+
+The fixed schedule (models.UPDATE_DELAYS) checks every article the
+same way, going only by how long ago it last changed.  Here, changes
+to an article are treated as a Poisson process whose rate drifts, and
+the rate is estimated from what we've seen of the article:
+
+ - change_score is a count of its changes in which older ones count
+   for less, decaying by a factor of e every DECAY;
+ - its rate is change_score over the (similarly decayed) time we've
+   been watching it, plus a prior of PRIOR_CHANGES over its age, so
+   a new article starts out at PRIOR_CHANGES per PRIOR_AGE and a
+   quiet one slows down like the fixed schedule does.
+
+Checking an article every `interval` then finds a new version with
+probability 1 - exp(-rate * interval).  For a given number of checks,
+the most new versions are caught by checking each article at a rate
+proportional to its change rate, i.e. interval = factor / rate, where
+factor is the expected number of changes between checks.  A fetch
+budget decides factor; see budget_factor().
+"""
+
+import math
+from datetime import timedelta
+
+# Time for a change's weight in change_score to fall by a factor of e
+DECAY = timedelta(days=1)
+# Prior belief: PRIOR_CHANGES changes over the first PRIOR_AGE
+PRIOR_CHANGES = 1.
+PRIOR_AGE = timedelta(hours=1)
+# Bounds on the interval between checks
+MIN_DELAY = timedelta(minutes=15)
+MAX_DELAY = timedelta(days=30)
+# Articles unchanged for this long are no longer checked
+MAX_AGE = timedelta(days=360)
+
+def hours(delta):
+    return max(delta.total_seconds(), 0) / 3600.
+
+def add_change(change_score, last_change, when):
+    """Return the change_score after a change at when.
+
+    last_change is when the previous change counted in change_score
+    happened.
+    """
+    return decayed(change_score, last_change, when) + 1
+
+def decayed(change_score, last_change, when):
+    if not change_score:
+        return 0.
+    return change_score * math.exp(-hours(when - last_change) /
+                                   hours(DECAY))
+
+def change_rate(change_score, last_change, first_seen, when):
+    """Estimate changes per hour at when"""
+    age = hours(when - first_seen)
+    watched = hours(DECAY) * (1 - math.exp(-age / hours(DECAY)))
+    return (decayed(change_score, last_change, when) /
+            (watched + hours(PRIOR_AGE)) +
+            PRIOR_CHANGES / (age + hours(PRIOR_AGE)))
+
+class AdaptivePolicy(object):
+    """Check each article every factor / change_rate hours.
+
+    factor is the expected number of changes between checks; smaller
+    means more checks.
+    """
+
+    def __init__(self, factor):
+        self.factor = factor
+
+    def delay(self, change_score, last_change, first_seen, when):
+        rate = change_rate(change_score, last_change, first_seen, when)
+        delay = timedelta(hours=self.factor / rate)
+        return min(max(delay, MIN_DELAY), MAX_DELAY)
+
+    def next_check_time(self, last_check, last_update, first_seen,
+                        change_score):
+        """Return when an article is next due for a check, or None for never.
+
+        last_update is when it last changed, or when it was first
+        seen if later.
+        """
+        due = last_check + self.delay(change_score, last_update, first_seen,
+                                      last_check)
+        if due >= last_update + MAX_AGE:
+            return None
+        return due
+
+def budget_factor(total_rate, budget):
+    """Return the factor spending about budget checks per hour.
+
+    total_rate is the sum of the change rates of the articles being
+    checked; each is checked rate / factor times an hour, give or take
+    the limits on delays.
+    """
+    return max(total_rate, 1e-9) / budget
+
+def replay(changes, first_seen, end, next_check_time):
+    """Simulate checking an article on a schedule, from first_seen to end.
+
+    changes are the sorted times of the article's versions; the first
+    check is when the first one appeared.  next_check_time is called
+    like AdaptivePolicy.next_check_time.  Return (checks, caught),
+    where a version is caught if it was the latest one at some check.
+    """
+    checks = caught = 0
+    seen = 0
+    # As the scraper does, the first version counts as a change too
+    last_update = first_seen
+    change_score = 0.
+    when = changes[0]
+    while when is not None and when < end:
+        checks += 1
+        latest = seen
+        while latest < len(changes) and changes[latest] <= when:
+            latest += 1
+        if latest > seen:
+            caught += 1
+            change_score = add_change(change_score, last_update, when)
+            last_update = when
+            seen = latest
+        when = next_check_time(when, last_update, first_seen, change_score)
+    return checks, caught
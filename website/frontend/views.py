@@ -4,6 +4,7 @@ import re
 from django.shortcuts import render_to_response, get_object_or_404, redirect
 from models import Article, Version
 import models
+import diffcache
 import json
 from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.core.urlresolvers import reverse
@@ -192,14 +193,16 @@ def old_diffview(request):
         return HttpResponseRedirect(reverse(front))
 
     try:
-        v1 = Version.objects.get(v=v1tag)
-        v2 = Version.objects.get(v=v2tag)
-    except Version.DoesNotExist:
+        article = Article.objects.get(url=url)
+    except Article.DoesNotExist:
         return Http400()
 
+    # Commits can hold several articles' versions, so look them up
+    # within the article.
     try:
-        article = Article.objects.get(url=url)
-    except Article.DoesNotExist:
+        v1 = Version.objects.get(v=v1tag, article=article)
+        v2 = Version.objects.get(v=v2tag, article=article)
+    except Version.DoesNotExist:
         return Http400()
 
     return redirect(reverse('diffview', kwargs=dict(vid1=v1.id,
@@ -228,10 +231,8 @@ def diffview(request, vid1, vid2, urlarg):
 
     adjacent_versions = []
     dates = []
-    texts = []
 
     for v in (v1, v2):
-        texts.append(v.text())
         dates.append(v.date.strftime(OUT_FORMAT))
 
         indices = [i for i, x in versions.items() if x == v]
@@ -243,7 +244,8 @@ def diffview(request, vid1, vid2, urlarg):
                                   for offset in (-1, 1)])
 
 
-    if any(x is None for x in texts):
+    diff_html = diffcache.get_html(v1, v2)
+    if diff_html is None:
         return Http400()
 
     links = []
@@ -259,7 +261,7 @@ def diffview(request, vid1, vid2, urlarg):
     return render_to_response('diffview.html', {
             'title': title,
             'date1':dates[0], 'date2':dates[1],
-            'text1':texts[0], 'text2':texts[1],
+            'diff_html': diff_html,
             'prev':links[0], 'next':links[1],
             'article_shorturl': article.filename(),
             'article_url': article.url, 'v1': v1, 'v2': v2,